@@ -0,0 +1,253 @@
+import time
+import cv2
+import numpy as np
+from mss import mss
+from mss.exception import ScreenShotError
+from frame import Frame
+
+class CaptureSession:
+    """
+    Screen grabber that lives for the whole run.
+    The mss instance (display handles and grab buffers) is created once instead of per capture,
+    and monitors are only enumerated again when the geometry changed: after a failed grab, or
+    when the periodic geometry check finds a different monitor layout.
+    mss handles belong to the thread that created them, so captures must stay on that thread.
+    """
+
+    # Regions closer than this many pixels are grabbed together, each grab has a fixed cost
+    MERGE_GAP = 64
+
+    def __init__(self, monitor_index=None, geometry_check_seconds=30.0):
+        """
+        Args:
+            monitor_index: 0-based index of the monitor to capture, None for the primary screen
+            geometry_check_seconds: How often the monitor layout is compared with the system's (0 disables)
+        """
+        self.monitor_index = monitor_index
+        self.geometry_check_seconds = geometry_check_seconds
+        self.sct = mss()
+        self.monitors = self.sct.monitors[1:]  # First entry is a combined view of all monitors
+        self.last_geometry_check = time.monotonic()
+        self.last_capture_seconds = 0.0
+
+    @property
+    def monitor(self):
+        """Geometry of the captured monitor, None when capturing the primary screen."""
+        if self.monitor_index is None or not 0 <= self.monitor_index < len(self.monitors):
+            return None
+        return self.monitors[self.monitor_index]
+
+    def primary_monitor(self):
+        """The monitor at the origin, which is what a full screen capture used to return."""
+        for monitor in self.monitors:
+            if monitor['left'] == 0 and monitor['top'] == 0:
+                return monitor
+        return self.monitors[0]
+
+    def refresh_monitors(self):
+        """Enumerate the monitors again, returns True if the layout changed."""
+        # mss enumerates monitors once per instance, so a fresh instance is needed to see changes
+        sct = mss()
+        monitors = sct.monitors[1:]
+        self.last_geometry_check = time.monotonic()
+        if monitors == self.monitors:
+            sct.close()
+            return False
+
+        self.sct.close()
+        self.sct = sct
+        self.monitors = monitors
+        print(f"Monitor layout changed, {len(monitors)} monitors found")
+        return True
+
+    def grab(self, region):
+        """Grab a screen region, re-enumerating the monitors once if the grab fails."""
+        try:
+            return self.sct.grab(region)
+        except ScreenShotError:
+            if not self.refresh_monitors():
+                raise
+            return None
+
+    def capture(self, regions=None):
+        """
+        Capture the selected monitor (or the primary screen) and return it as a Frame.
+        With regions (frame-global (x, y, w, h) rectangles) only those parts of the screen are grabbed,
+        the Frame then covers their bounding box at its offset and everything else in it is black.
+        """
+        if self.geometry_check_seconds and time.monotonic() - self.last_geometry_check > self.geometry_check_seconds:
+            self.refresh_monitors()
+
+        start = time.perf_counter()
+        frame = self.grab_frame(regions)
+        if frame is None:
+            # The layout changed under the grab, try again with the new geometry
+            frame = self.grab_frame(regions)
+        self.last_capture_seconds = time.perf_counter() - start
+        return frame
+
+    def grab_frame(self, regions=None):
+        """Grab the screen or the given regions into a Frame, None if the monitor layout changed meanwhile."""
+        area = self.monitor or self.primary_monitor()
+        rectangles = self.clip_rectangles(self.merge_rectangles(regions, self.MERGE_GAP), area) if regions else []
+
+        # Full screen captures keep monitor=None, as before, so their coordinates stay screen-global
+        if not rectangles:
+            shot = self.grab(area)
+            return None if shot is None else Frame(self.to_array(shot), monitor=self.monitor)
+
+        # Region frames keep the captured area as their geometry, so per-monitor caches see one screen
+        geometry = (area['left'], area['top'], area['width'], area['height'])
+        tiles = []
+        for x, y, w, h in rectangles:
+            shot = self.grab({'left': area['left'] + x, 'top': area['top'] + y, 'width': w, 'height': h})
+            if shot is None:
+                return None
+            tiles.append((x, y, self.to_array(shot)))
+        if len(tiles) == 1:
+            x, y, image = tiles[0]
+            return Frame(image, (x, y), self.monitor, geometry)
+
+        # Several separate regions are pasted onto one canvas covering their bounding box
+        left = min(x for x, _, _ in tiles)
+        top = min(y for _, y, _ in tiles)
+        right = max(x + image.shape[1] for x, _, image in tiles)
+        bottom = max(y + image.shape[0] for _, y, image in tiles)
+        canvas = np.zeros((bottom - top, right - left, 4), dtype=np.uint8)
+        for x, y, image in tiles:
+            canvas[y - top:y - top + image.shape[0], x - left:x - left + image.shape[1]] = image
+        return Frame(canvas, (left, top), self.monitor, geometry)
+
+    @staticmethod
+    def to_array(shot):
+        # View the grabbed BGRA pixels as an array without copying, mss hands every grab its own buffer
+        return np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+
+    @staticmethod
+    def merge_rectangles(rectangles, gap=0):
+        """Merge (x, y, w, h) rectangles that overlap or lie within gap pixels of each other into their bounding boxes."""
+        boxes = [(int(x), int(y), int(x) + int(w), int(y) + int(h)) for x, y, w, h in rectangles]
+        merged = True
+        while merged:
+            merged = False
+            for i in range(len(boxes)):
+                for j in range(i + 1, len(boxes)):
+                    a, b = boxes[i], boxes[j]
+                    if a[0] - gap <= b[2] and b[0] - gap <= a[2] and a[1] - gap <= b[3] and b[1] - gap <= a[3]:
+                        boxes[i] = (min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3]))
+                        del boxes[j]
+                        merged = True
+                        break
+                if merged:
+                    break
+        return [(x0, y0, x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes]
+
+    @staticmethod
+    def clip_rectangles(rectangles, area):
+        """Clip frame-global rectangles to the captured area, dropping the ones left empty."""
+        clipped = []
+        for x, y, w, h in rectangles:
+            x0, y0 = max(0, x), max(0, y)
+            x1, y1 = min(area['width'], x + w), min(area['height'], y + h)
+            if x1 > x0 and y1 > y0:
+                clipped.append((x0, y0, x1 - x0, y1 - y0))
+        return clipped
+
+    def close(self):
+        self.sct.close()
+
+class CaptureScheduler:
+    """
+    Decides when a capture is taken, according to a settle policy:
+        'immediate'  capture right away
+        'stable'     capture once two consecutive grabs are identical (or the timeout is reached)
+        'delay'      wait a fixed number of seconds, then capture (the original behaviour)
+
+    Settings (scenario-wide "settle", per template or per action) are given as a policy name,
+    a number of seconds for 'delay', or a dict such as {"policy": "stable", "timeout": 2.0}.
+    """
+
+    POLICIES = ('immediate', 'stable', 'delay')
+
+    # Defaults of the policy options
+    DELAY_SECONDS = 3.0
+    STABLE_INTERVAL = 0.05  # Seconds between the grabs compared by 'stable'
+    STABLE_TIMEOUT = 3.0  # Never wait longer than the original fixed delay
+    STABLE_PIXEL_THRESHOLD = 0  # Gray levels a pixel may change by and still count as stable
+
+    def __init__(self, session, default_settle=None):
+        self.session = session
+        self.default = self.parse(default_settle) if default_settle is not None else self.parse('delay')
+        self.last_settle_seconds = 0.0
+
+    @classmethod
+    def parse(cls, settle):
+        """Normalize a settle setting to a dict with every option of its policy, None if not set."""
+        if settle is None:
+            return None
+        if isinstance(settle, dict):
+            options = dict(settle)
+        elif isinstance(settle, (int, float)) and not isinstance(settle, bool):
+            options = {'policy': 'delay', 'seconds': settle}
+        else:
+            options = {'policy': settle}
+
+        if options.get('policy') not in cls.POLICIES:
+            print(f"Unknown settle policy '{options.get('policy')}', using 'delay'")
+            options['policy'] = 'delay'
+        options.setdefault('seconds', cls.DELAY_SECONDS)
+        options.setdefault('interval', cls.STABLE_INTERVAL)
+        options.setdefault('timeout', cls.STABLE_TIMEOUT)
+        options.setdefault('pixel_threshold', cls.STABLE_PIXEL_THRESHOLD)
+        return options
+
+    def capture(self, settle=None, prepare=None, check=None, regions=None):
+        """
+        Capture a Frame once the screen has settled.
+
+        Args:
+            settle: Settle setting for this capture, None for the scenario default
+            prepare: Called with the settle options right before the first grab (e.g. to move the cursor away)
+            check: Called while waiting, may raise to abort (e.g. the kill switch)
+            regions: Frame-global rectangles to grab instead of the whole screen (see CaptureSession.capture)
+        """
+        settle = self.parse(settle) or self.default
+        start = time.perf_counter()
+
+        if settle['policy'] == 'delay':
+            print(f"Waiting for {settle['seconds']} seconds before capturing screenshot...")
+            self.sleep(settle['seconds'], check)
+
+        if prepare:
+            prepare(settle)
+
+        frame = self.session.capture(regions)
+        if settle['policy'] == 'stable':
+            deadline = time.perf_counter() + settle['timeout']
+            while time.perf_counter() < deadline:
+                self.sleep(settle['interval'], check)
+                previous, frame = frame, self.session.capture(regions)
+                if previous.shape == frame.shape and self.unchanged(previous, frame, settle['pixel_threshold']):
+                    break
+            else:
+                print(f"Screen did not settle within {settle['timeout']} seconds, using the last capture")
+
+        # Time spent settling: waits plus the comparison grabs of 'stable', without the final grab
+        self.last_settle_seconds = max(0.0, time.perf_counter() - start - self.session.last_capture_seconds)
+        return frame
+
+    @staticmethod
+    def unchanged(previous, frame, pixel_threshold):
+        return cv2.norm(previous.gray, frame.gray, cv2.NORM_INF) <= pixel_threshold
+
+    @staticmethod
+    def sleep(seconds, check=None):
+        # Sleep in short steps so the check (kill switch) stays responsive
+        end = time.perf_counter() + seconds
+        while True:
+            if check:
+                check()
+            remaining = end - time.perf_counter()
+            if remaining <= 0:
+                break
+            time.sleep(min(remaining, 0.25))
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+
+class ChangeDetector:
+    """
+    Finds the parts of the screen that changed between two consecutive captures.
+    The frames are compared block by block; a block is dirty when any of its pixels changed by
+    more than pixel_threshold gray levels. Everything is dirty for the first frame and whenever
+    the captured area (size, position or monitor) changes.
+    """
+
+    def __init__(self, block_size=32, pixel_threshold=0):
+        self.block_size = max(1, int(block_size))
+        self.pixel_threshold = max(0, int(pixel_threshold))
+        self.previous = None  # Last compared frame
+        self.dirty = None  # Boolean block grid of the last comparison, None = everything dirty
+
+    def update(self, frame):
+        """Compare a new frame with the previous one and return the dirty block grid (None = all dirty)."""
+        previous, self.previous = self.previous, frame
+        if previous is frame:
+            # Same capture again, nothing can have changed
+            self.dirty = np.zeros(self.grid_shape(frame), dtype=bool)
+            return self.dirty
+
+        if (previous is None or previous.shape != frame.shape or previous.offset != frame.offset
+                or previous.monitor_key != frame.monitor_key):
+            self.dirty = None
+            return self.dirty
+
+        changed = cv2.absdiff(frame.gray, previous.gray) > self.pixel_threshold
+
+        # Pad to whole blocks, then a block is dirty if any pixel in it changed
+        block = self.block_size
+        frame_h, frame_w = changed.shape
+        grid_h, grid_w = self.grid_shape(frame)
+        padded = np.zeros((grid_h * block, grid_w * block), dtype=bool)
+        padded[:frame_h, :frame_w] = changed
+        self.dirty = padded.reshape(grid_h, block, grid_w, block).any(axis=(1, 3))
+        return self.dirty
+
+    def grid_shape(self, frame):
+        """(rows, columns) of the block grid covering a frame."""
+        frame_h, frame_w = frame.shape
+        return -(-frame_h // self.block_size), -(-frame_w // self.block_size)
+
+    def dirty_rectangles(self):
+        """Frame-global (x, y, w, h) rectangles covering the dirty blocks of the last comparison."""
+        frame = self.previous
+        if frame is None:
+            return []
+        frame_h, frame_w = frame.shape
+        offset_x, offset_y = frame.offset
+        if self.dirty is None:
+            return [(offset_x, offset_y, frame_w, frame_h)]
+
+        # Connected dirty blocks are reported as one rectangle
+        count, _, boxes, _ = cv2.connectedComponentsWithStats(self.dirty.astype(np.uint8), connectivity=8)
+        block = self.block_size
+        rectangles = []
+        for grid_x, grid_y, grid_w, grid_h, _ in boxes[1:count].tolist():
+            x, y = grid_x * block, grid_y * block
+            rectangles.append((offset_x + x, offset_y + y,
+                               min(frame_w, (grid_x + grid_w) * block) - x,
+                               min(frame_h, (grid_y + grid_h) * block) - y))
+        return rectangles
+
+    def is_clean(self, box):
+        """Whether a frame-global (x, y, w, h) box lies entirely in blocks that did not change."""
+        if self.dirty is None or box is None:
+            return False
+        x, y, w, h = box
+        offset_x, offset_y = self.previous.offset
+        block = self.block_size
+        x0, y0 = max(0, (x - offset_x) // block), max(0, (y - offset_y) // block)
+        x1, y1 = (x - offset_x + w - 1) // block + 1, (y - offset_y + h - 1) // block + 1
+        return not self.dirty[y0:y1, x0:x1].any()
@@ -0,0 +1,163 @@
+import hashlib
+import threading
+import cv2
+import numpy as np
+
+class Frame:
+    """
+    A single screen capture shared by every matcher.
+    Derived data (grayscale, pyramid levels, spectra, keypoints, content hash) is
+    computed on first use and memoized, so each item is paid for once per capture.
+    Memoization is thread-safe, so matchers running on worker threads can share a frame.
+    """
+
+    def __init__(self, image, offset=(0, 0), monitor=None, geometry=None):
+        # Colour (BGR or BGRA) or already grayscale image as returned by the capture
+        self.image = image
+        
+        # Position of the top-left pixel in frame-global coordinates (non-zero for sub-regions)
+        self.offset = offset
+        
+        # Monitor geometry (mss monitor dict) the frame was captured from, None for the full screen
+        self.monitor = monitor
+        
+        # (left, top, width, height) of the whole screen area the frame belongs to, for region captures
+        # and sub-frames that only cover part of it; None = the monitor, or this image if there is none
+        self.geometry = tuple(geometry) if geometry else None
+
+        self._gray = None
+        self._pyramid = None
+        self._spectra = {}
+        self._keypoints = {}
+        self._content_hash = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_source(cls, source):
+        """Wrap a Frame, an image path or an in-memory image into a Frame."""
+        if isinstance(source, Frame):
+            return source
+        if isinstance(source, str):
+            image = cv2.imread(source, cv2.IMREAD_COLOR)
+            if image is None:
+                raise FileNotFoundError(f"Could not load screenshot: {source}")
+            return cls(image)
+        return cls(source)
+
+    @property
+    def gray(self):
+        """Grayscale version of the capture."""
+        if self._gray is None:
+            with self._lock:
+                if self._gray is None:
+                    if self.image.ndim == 2:
+                        self._gray = self.image
+                    elif self.image.shape[2] == 4:
+                        # Screen captures arrive as BGRA, converted straight to gray without a BGR copy
+                        self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGRA2GRAY)
+                    else:
+                        self._gray = cv2.cvtColor(self.image, cv2.COLOR_BGR2GRAY)
+        return self._gray
+
+    @property
+    def bgr(self):
+        """Colour image without the alpha channel of BGRA captures (a view, not a copy)."""
+        if self.image.ndim == 3 and self.image.shape[2] == 4:
+            return self.image[:, :, :3]
+        return self.image
+
+    def canvas(self):
+        """BGR image in frame-global coordinates: region captures are drawn at their offset on black."""
+        if self.offset == (0, 0):
+            return self.bgr
+        frame_h, frame_w = self.shape
+        offset_x, offset_y = self.offset
+        bgr = self.bgr if self.image.ndim == 3 else cv2.cvtColor(self.image, cv2.COLOR_GRAY2BGR)
+        canvas_h, canvas_w = offset_y + frame_h, offset_x + frame_w
+        # Draw on the whole screen area so the capture keeps its place on screen
+        _, _, screen_w, screen_h = self.monitor_key
+        canvas_h, canvas_w = max(canvas_h, screen_h), max(canvas_w, screen_w)
+        canvas = np.zeros((canvas_h, canvas_w, 3), dtype=np.uint8)
+        canvas[offset_y:offset_y + frame_h, offset_x:offset_x + frame_w] = bgr
+        return canvas
+
+    @property
+    def monitor_key(self):
+        """Hashable monitor geometry (left, top, width, height) used to key per-monitor caches."""
+        if self.geometry:
+            return self.geometry
+        if self.monitor:
+            return (self.monitor['left'], self.monitor['top'], self.monitor['width'], self.monitor['height'])
+        frame_h, frame_w = self.image.shape[:2]
+        return (0, 0, frame_w, frame_h)
+
+    @property
+    def covers_screen(self):
+        """Whether the frame is the whole screen area, not a region capture or a sub-frame of one."""
+        frame_h, frame_w = self.image.shape[:2]
+        _, _, screen_w, screen_h = self.monitor_key
+        return self.offset == (0, 0) and (frame_w, frame_h) == (screen_w, screen_h)
+
+    @property
+    def shape(self):
+        """(height, width) of the capture."""
+        return self.gray.shape[:2]
+
+    def region(self, x, y, width, height):
+        """
+        Sub-frame covering the given rectangle in frame-global coordinates, clipped to this frame.
+        The sub-frame shares pixel memory with this frame; returns None if nothing is left after clipping.
+        """
+        frame_h, frame_w = self.image.shape[:2]
+        x0 = max(0, int(x) - self.offset[0])
+        y0 = max(0, int(y) - self.offset[1])
+        x1 = min(frame_w, int(x) + int(width) - self.offset[0])
+        y1 = min(frame_h, int(y) + int(height) - self.offset[1])
+        if x1 <= x0 or y1 <= y0:
+            return None
+        
+        sub_frame = Frame(self.image[y0:y1, x0:x1], (self.offset[0] + x0, self.offset[1] + y0), self.monitor,
+                          self.monitor_key)
+        if self._gray is not None:
+            sub_frame._gray = self._gray[y0:y1, x0:x1]
+        return sub_frame
+
+    def pyramid(self, level):
+        """Grayscale image downscaled `level` times by cv2.pyrDown (level 0 = full resolution)."""
+        with self._lock:
+            if self._pyramid is None:
+                self._pyramid = [self.gray]
+            while len(self._pyramid) <= level:
+                self._pyramid.append(cv2.pyrDown(self._pyramid[-1]))
+            return self._pyramid[level]
+
+    def spectrum(self, dft_h, dft_w):
+        """Fourier spectrum (CCS packed, float64) of the grayscale capture zero-padded to dft_h x dft_w."""
+        key = (dft_h, dft_w)
+        with self._lock:
+            if key not in self._spectra:
+                gray_h, gray_w = self.shape
+                padded = np.zeros((dft_h, dft_w), dtype=np.float64)
+                padded[:gray_h, :gray_w] = self.gray
+                self._spectra[key] = cv2.dft(padded, nonzeroRows=gray_h)
+            return self._spectra[key]
+
+    def keypoints(self, name, create_detector):
+        """
+        (points, descriptors) of the keypoints found by a feature detector, computed once per detector name.
+        points is an (N, 2) float32 array of keypoint positions in frame-local coordinates.
+        """
+        with self._lock:
+            if name not in self._keypoints:
+                keypoints, descriptors = create_detector().detectAndCompute(self.gray, None)
+                points = np.float32([keypoint.pt for keypoint in keypoints]).reshape(-1, 2)
+                self._keypoints[name] = (points, descriptors)
+            return self._keypoints[name]
+
+    @property
+    def content_hash(self):
+        """Hex digest of the grayscale pixels, identical captures share the same hash."""
+        if self._content_hash is None:
+            # Racing threads compute the same digest, so no lock is needed here
+            self._content_hash = hashlib.blake2b(np.ascontiguousarray(self.gray), digest_size=16).hexdigest()
+        return self._content_hash
@@ -0,0 +1,65 @@
+import os
+import queue
+import threading
+import cv2
+
+class FrameSink:
+    """
+    Writes captured frames to disk on a background thread so the main loop never waits for encoding.
+    Only the latest frames matter (the file is overwritten), so when the bounded queue is full the
+    oldest pending frame is dropped instead of blocking the caller.
+    Files are written under a temporary name and then renamed, readers never see a partial image.
+    """
+
+    # Encoder settings per format: PNG at the fastest compression level, BMP is stored raw
+    FORMATS = {
+        'png': [cv2.IMWRITE_PNG_COMPRESSION, 1],
+        'bmp': [],
+    }
+
+    def __init__(self, output_path, max_queue=2):
+        extension = os.path.splitext(output_path)[1].lower().lstrip('.')
+        if extension not in self.FORMATS:
+            print(f"Unknown screenshot format '{extension}', using 'png'")
+            output_path = os.path.splitext(output_path)[0] + '.png'
+            extension = 'png'
+        self.output_path = output_path
+        self.params = self.FORMATS[extension]
+        self.written = 0
+        self.dropped = 0
+        self.queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self.thread = threading.Thread(target=self.run, name='frame-sink', daemon=True)
+        self.thread.start()
+
+    def submit(self, frame):
+        """Queue a frame for writing, never blocks."""
+        while True:
+            try:
+                self.queue.put_nowait(frame)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            frame = self.queue.get()
+            if frame is None:
+                break
+            root, extension = os.path.splitext(self.output_path)
+            temp_path = root + '.tmp' + extension
+            try:
+                os.makedirs(os.path.dirname(self.output_path) or '.', exist_ok=True)
+                if cv2.imwrite(temp_path, frame.bgr, self.params):
+                    os.replace(temp_path, self.output_path)
+                    self.written += 1
+            except (OSError, cv2.error) as e:
+                print(f"Warning: Could not save screenshot {self.output_path}: {e}")
+
+    def close(self):
+        """Write the frames still queued, then stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
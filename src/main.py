@@ -1,6 +1,8 @@
-import cv2
-import numpy as np
 from template_matcher import TemplateMatcher
+from template_bank import TemplateBank
+from template_cache import TemplateCache
+from capture import CaptureSession, CaptureScheduler
+from frame_sink import FrameSink
 from visualizer import display_results
 from action_performer import ActionPerformer
 from monitor_option import get_monitors, select_monitor
@@ -12,8 +14,6 @@ import json
 import keyboard
 import threading
 import signal
-from PIL import Image
-from mss import mss
 import argparse
 from config_editor.config_manager import find_scenario_files
 
@@ -21,6 +21,14 @@ from config_editor.config_manager import find_scenario_files
 kill_switch_activated = False
 # Global monitor selection
 selected_monitor = None
+# Screen grabber kept open for the whole run
+capture_session = None
+# Decides when captures are taken (settle policies)
+capture_scheduler = None
+# Background writer of the captured frames, None when screenshots are not saved
+frame_sink = None
+# Seconds spent in each stage (capture, match) during the current iteration
+stage_timings = {}
 
 def setup_kill_switch():
     """Setup a global kill switch (Ctrl+Esc) to stop the program from anywhere."""
@@ -42,20 +50,28 @@ def check_kill_switch():
         # Exit with a non-zero code to indicate it wasn't a normal termination
         sys.exit(1)
 
-def capture_screenshot(output_path=None, delay=3.0):
-    """Capture a screenshot and optionally save it to the specified path."""
-    # Check kill switch before potentially lengthy operation
-    check_kill_switch()
-    
-    # Add a delay before taking the screenshot
-    print(f"Waiting for {delay} seconds before capturing screenshot...")
-    time.sleep(delay)
-    
-    # Move cursor to center of screen BEFORE taking screenshot
-    # This helps avoid hover effects when searching for icons
+def record_stage_timing(stage, seconds):
+    stage_timings.setdefault(stage, []).append(seconds)
+
+def report_stage_timings():
+    """Print the stage timings of the current iteration and start over."""
+    parts = []
+    for stage, durations in stage_timings.items():
+        average_ms = sum(durations) / len(durations) * 1000
+        if len(durations) > 1:
+            parts.append(f"{stage} {len(durations)} x {average_ms:.1f} ms")
+        else:
+            parts.append(f"{stage} {average_ms:.1f} ms")
+    if parts:
+        print("Stage timings: " + ", ".join(parts))
+    stage_timings.clear()
+
+def reset_cursor(settle):
+    """
+    Move the cursor to the center of the screen/monitor so hover effects do not change the capture.
+    The 'delay' policy keeps the original animated move and pause, the faster policies move instantly.
+    """
     try:
-        global selected_monitor
-        
         if selected_monitor:
             # Calculate center of the selected monitor
             center_x = selected_monitor['left'] + selected_monitor['width'] // 2
@@ -64,33 +80,45 @@ def capture_screenshot(output_path=None, delay=3.0):
             # Get screen size
             screen_width, screen_height = pyautogui.size()
             center_x, center_y = screen_width // 2, screen_height // 2
-            
+        
         # Move cursor to center of screen/monitor
-        pyautogui.moveTo(center_x, center_y, duration=0.2)
+        pyautogui.moveTo(center_x, center_y, duration=0.2 if settle['policy'] == 'delay' else 0)
         print(f"Cursor reset to center ({center_x}, {center_y})")
     except Exception as e:
         print(f"Error resetting cursor position: {e}")
     
-    # Small delay to ensure cursor movement is complete
-    time.sleep(0.1)
+    if settle['policy'] == 'delay':
+        # Small delay to ensure cursor movement is complete
+        time.sleep(0.1)
+
+def capture_screenshot(settle=None, regions=None):
+    """
+    Capture a screenshot once the screen settled, saving it in the background if a frame sink is set up.
+    settle overrides the scenario's settle policy for this capture (see CaptureScheduler).
+    regions limits the capture to these (x, y, w, h) rectangles relative to the monitor, None grabs everything.
+    Returns a Frame shared by every template matcher for this capture.
+    """
+    global selected_monitor
     
-    # Now take the screenshot
-    if selected_monitor:
-        # Use mss to capture the specific monitor
-        with mss() as sct:
-            # Capture the selected monitor
-            screenshot_mss = sct.grab(selected_monitor)
-            # Convert to PIL Image
-            screenshot = Image.frombytes("RGB", screenshot_mss.size, screenshot_mss.bgra, "raw", "BGRX")
-    else:
-        # Capture the entire screen using pyautogui
-        screenshot = pyautogui.screenshot()
+    # Check kill switch before potentially lengthy operation
+    check_kill_switch()
+    
+    # Wait according to the settle policy, reset the cursor, then grab with the session kept open for the run
+    frame = capture_scheduler.capture(settle, prepare=reset_cursor, check=check_kill_switch, regions=regions)
+    record_stage_timing('settle', capture_scheduler.last_settle_seconds)
+    record_stage_timing('capture', capture_session.last_capture_seconds)
+    
+    if regions:
+        frame_h, frame_w = frame.shape
+        print(f"Captured only the templates' search regions: {frame_w}x{frame_h} at {frame.offset}")
     
-    if output_path:
-        screenshot.save(output_path)
+    # The session re-enumerates monitors when the layout changes, follow the new geometry
+    selected_monitor = frame.monitor
     
-    # Convert PIL image to OpenCV format
-    return cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+    if frame_sink is not None:
+        frame_sink.submit(frame)
+    
+    return frame
 
 def load_config(base_dir, scenario_file=None):
     """Load configuration from the specified scenario file or select from available scenarios."""
@@ -138,6 +166,70 @@ def load_config(base_dir, scenario_file=None):
         else:
             raise
 
+def template_matcher_options(config, template_config=None):
+    """
+    Keyword arguments for TemplateMatcher from the scenario settings.
+    Settings given in the template config take precedence over the scenario-wide ones.
+    """
+    template_config = template_config or {}
+    
+    def setting(key, default, scenario_key=None):
+        if key in template_config:
+            return template_config[key]
+        return config.get(scenario_key or key, default)
+    
+    return {
+        # Coarse-to-fine pyramid search (0 levels = full resolution only)
+        'pyramid_levels': setting('pyramid_levels', 0),
+        'pyramid_candidates': setting('pyramid_candidates', 3),
+        # Matching engine: 'direct' (cv2.matchTemplate), 'fft' (cached template spectra), 'auto',
+        # or 'orb' / 'akaze' keypoint matching for rotated, scaled or partly covered icons (methods are not used)
+        'engine': setting('engine', 'direct', 'default_template_engine'),
+        'keypoint_min_inliers': setting('keypoint_min_inliers', 10),
+        # Optional search region [x, y, width, height] relative to the captured monitor (per template only)
+        'search_region': template_config.get('search_region'),
+        # Padding (pixels) of the window searched around the previous hit first, 0 disables the hint
+        'hint_padding': setting('last_hit_padding', 100),
+        # Seconds an unchanged last-hit patch may be reused without searching, 0 always searches
+        'last_hit_max_age': setting('last_hit_max_age', 5.0),
+        # Multi-scale matching, e.g. "scale_range": [1.0, 1.5] for 100%-150% display scaling
+        # The winning scale is remembered per monitor, so later frames only try that one
+        'scales': TemplateMatcher.scales_from_range(setting('scale_range', None), setting('scale_steps', 5)),
+        # Cascade mode: stop matching as soon as one normed method is below the threshold
+        'cascade': setting('cascade', False),
+        # Combined mode: one cross-correlation per search, every method's map is derived from it
+        'combined': setting('combined_methods', False),
+        # Adaptive methods: after a warm-up, only the smallest method subset that reproduces past decisions
+        # runs; every adaptive_audit_interval-th search runs all methods again to catch drift
+        'adaptive_methods': setting('adaptive_methods', False),
+        'adaptive_warmup': setting('adaptive_warmup', 20),
+        'adaptive_audit_interval': setting('adaptive_audit_interval', 10),
+        # Pre-filter: rule out positions whose mean/std (gray levels) differ too much from the template's
+        'prefilter': setting('prefilter', False),
+        'prefilter_mean_tolerance': setting('prefilter_mean_tolerance', 30.0),
+        'prefilter_std_tolerance': setting('prefilter_std_tolerance', 30.0),
+        # Multi-instance mode: act on the Nth instance (0-based) in the given order instead of the best match
+        'instance_index': template_config.get('instance_index'),
+        'instance_order': setting('instance_order', 'score'),
+        'max_instances': setting('max_instances', 10)
+    }
+
+def eligible_template_names(template_order, start, template_names, template_enabled,
+                            template_dependencies, executed_template_names):
+    """
+    Names of the templates the main loop would process from position `start` if nothing matches:
+    enabled templates in order, up to the first one with an unsatisfied dependency.
+    """
+    names = []
+    for template in template_order[start:]:
+        if not template_enabled.get(template, True):
+            continue
+        depends_on_name = template_dependencies.get(template)
+        if depends_on_name and depends_on_name not in executed_template_names:
+            break
+        names.append(template_names[template])
+    return names
+
 def main():
     # Set up command line argument parsing
     parser = argparse.ArgumentParser(description='Screen Icon Detector')
@@ -157,20 +249,28 @@ def main():
     setup_kill_switch()
     
     # Handle monitor selection based on configuration 
-    global selected_monitor
+    global selected_monitor, capture_session, capture_scheduler, frame_sink
     monitor_settings = config.get('monitor_settings', {})
     enable_monitor_selection = monitor_settings.get('enable_monitor_selection', False)
     
+    # One grabber for the whole run, the monitor layout is checked every "geometry_check_seconds"
+    capture_session = CaptureSession(geometry_check_seconds=monitor_settings.get('geometry_check_seconds', 30.0))
+    
+    # When captures are taken: "settle" is "immediate", "stable", a delay in seconds or a dict with options,
+    # templates and actions can override it; the default keeps the original 3 second delay
+    capture_scheduler = CaptureScheduler(capture_session, config.get('settle'))
+    
     if enable_monitor_selection:
         # Get available monitors
-        monitors = get_monitors()
+        monitors = get_monitors(capture_session)
         
         # Get monitor index from configuration
         default_index = monitor_settings.get('default_monitor_index', 0)
         
         # Check if the index is valid
         if 0 <= default_index < len(monitors):
-            selected_monitor = monitors[default_index]
+            capture_session.monitor_index = default_index
+            selected_monitor = capture_session.monitor
             print(f"Using monitor {default_index+1}: {selected_monitor['width']}x{selected_monitor['height']} at position ({selected_monitor['left']}, {selected_monitor['top']})")
         else:
             print(f"Invalid monitor_index {default_index} in scenario_default.json (found {len(monitors)} monitors). Using full screen.")
@@ -181,15 +281,37 @@ def main():
     templates_dir = os.path.normpath(os.path.join(base_dir, 'templates'))
     screenshots_dir = os.path.normpath(os.path.join(base_dir, 'screenshots'))
     
+    # Frames are passed between the stages in memory, saving a copy to disk happens on a background thread
+    # "screenshot_format": "bmp" writes raw bitmaps, "save_screenshots": false disables saving
+    if config.get('save_screenshots', True):
+        frame_sink = FrameSink(os.path.join(screenshots_dir, 'current_screenshot.' + config.get('screenshot_format', 'png')))
+    
     # Get default template matching methods and thresholds from config
     default_template_methods = config.get('default_template_methods', config.get('template_methods', ['TM_CCOEFF_NORMED']))
     threshold = config.get('match_threshold', 0.8)
     distance_pixels_threshold = config.get('match_distance_pixels_threshold', 50)
     
+    # Decoded templates and their derived data are cached on disk, "template_cache": false disables it
+    template_cache = None
+    if config.get('template_cache', True):
+        try:
+            template_cache = TemplateCache(os.path.normpath(os.path.join(base_dir, 'cache', 'templates')))
+        except OSError as e:
+            print(f"Warning: Template cache disabled: {e}")
+    
     # Load templates with their specific methods and actions
     templates_config = config['templates']
-    template_matchers = {}
+    # Owns the matchers of every template path, "max_workers" > 1 matches templates and methods in parallel
+    # "matching_backend": "process" runs the matchers in worker processes instead of threads
+    # "change_detection" reuses the results of templates whose search area did not change between captures
+    template_bank = TemplateBank(
+        config.get('max_workers', 1),
+        config.get('matching_backend', 'thread'),
+        config.get('change_detection', True),
+        config.get('change_block_size', 32)
+    )
     template_actions = {}  # Store actions for each template path
+    template_settle = {}  # Settle policy of the captures after each template's actions (None = scenario default)
     template_enabled = {}  # Store enabled status for each template
     template_dependencies = {}  # Store dependencies between templates
     template_order = []  # Preserve template order from config
@@ -231,14 +353,19 @@ def main():
             # Use template-specific methods if provided, otherwise use default methods
             template_methods = template_config.get('methods', default_template_methods)
             
-            # Create a matcher for each path and store in template_matchers
+            # Use template-specific matcher settings if provided, otherwise use scenario defaults
+            matcher_options = template_matcher_options(config, template_config)
+            
+            # Create a matcher for each path and register it in the template bank
             for template_path in template_paths:
-                template_matchers[template_path] = TemplateMatcher(
+                template_bank.add(template_name, template_path, TemplateMatcher(
                     template_path, 
                     template_methods, 
                     threshold,
-                    distance_pixels_threshold
-                )
+                    distance_pixels_threshold,
+                    template_cache=template_cache,
+                    **matcher_options
+                ))
                 
                 # Store template name for later dependency resolution
                 template_names[template_path] = template_name
@@ -250,6 +377,7 @@ def main():
             # Store actions, enabled status, and dependencies for all paths
             for path in template_paths:
                 template_actions[path] = template_config.get('actions', [])
+                template_settle[path] = template_config.get('settle')
                 template_enabled[path] = template_config.get('enabled', True)
                 if 'depends_on' in template_config:
                     template_dependencies[path] = template_config['depends_on']
@@ -260,21 +388,26 @@ def main():
     else:
         for template_path in templates_config:
             template_path = os.path.normpath(os.path.join(base_dir, template_path))
-            template_matchers[template_path] = TemplateMatcher(
+            template_name = os.path.basename(template_path)
+            template_bank.add(template_name, template_path, TemplateMatcher(
                 template_path, 
                 default_template_methods, 
                 threshold,
-                distance_pixels_threshold
-            )
+                distance_pixels_threshold,
+                template_cache=template_cache,
+                **template_matcher_options(config)
+            ))
             
             # For backward compatibility - get actions from the old 'actions' object
-            template_name = os.path.basename(template_path)
             template_actions[template_path] = config.get('actions', {}).get(template_name, [])
     
-    if not template_matchers:
+    if not len(template_bank):
         print("No templates found in the configuration.")
         sys.exit(1)
     
+    if template_cache is not None:
+        print(f"Template cache: {template_cache.hits} loaded from cache, {template_cache.misses} decoded")
+    
     # DO NOT resolve dependencies to paths - keep them as names
     # We want to reference dependency relationships by template name, not by specific path
     
@@ -308,8 +441,16 @@ def main():
             check_kill_switch()
             
             # Capture a new screenshot at the beginning of each iteration
-            screenshot_path = os.path.normpath(os.path.join(screenshots_dir, 'current_screenshot.png'))
-            screenshot = capture_screenshot(screenshot_path)
+            # The frame is created once and shared by all matchers (grayscale etc. computed once)
+            # If every template that can run in this iteration has a search region, only those regions are grabbed
+            capture_regions = None
+            if config.get('region_capture', True):
+                capture_regions = template_bank.search_regions(eligible_template_names(
+                    template_order, 0, template_names, template_enabled, template_dependencies, executed_template_names))
+            frame = capture_screenshot(regions=capture_regions)
+            if action_performer.selected_monitor != selected_monitor:
+                # Monitor layout changed, click at the new geometry
+                action_performer.set_monitor(selected_monitor)
             
             # Flag to track if any template was matched in this iteration
             template_matched = False
@@ -317,8 +458,11 @@ def main():
             # Flag to track if we should stop after current template
             stop_after_current = False
             
+            # Match results for the current frame, filled by one template bank call per frame
+            frame_results = {}
+            
             # Process templates in the order defined in the config
-            for template in template_order:
+            for index, template in enumerate(template_order):
                 # Get current template name
                 template_name = template_names[template]
                 
@@ -337,53 +481,64 @@ def main():
                         stop_after_current = True
                         break
                 
-                # Find all paths for this template name
-                template_paths = [p for p, n in template_names.items() if n == template_name]
+                # With worker threads or processes, every template that can still run in this iteration is matched
+                # against the frame in one call. Sequentially a template is only matched when the loop reaches it,
+                # results computed ahead would be thrown away as soon as an earlier template's actions change the frame
+                if template_name not in frame_results:
+                    # Check kill switch before the template matching operation
+                    check_kill_switch()
+                    
+                    if template_bank.parallel:
+                        pending_names = eligible_template_names(template_order, index, template_names, template_enabled,
+                                                                template_dependencies, executed_template_names)
+                    else:
+                        pending_names = [template_name]
+                    match_start = time.perf_counter()
+                    frame_results = template_bank.match_all(frame, pending_names)
+                    record_stage_timing('match', time.perf_counter() - match_start)
+                
+                result = frame_results[template_name]
+                match_found = bool(result and result.coordinates)
+                match_results = result.match_results if result else None
+                if match_results is not None and match_results.pruned_fraction:
+                    print(f"Pre-filter ruled out {match_results.pruned_fraction:.1%} of positions for template: {template_name}")
                 
-                # Try each path until we find a match
-                match_found = False
-                for path in template_paths:
-                    template_matcher = template_matchers[path]
+                if match_found:
+                    template_matched = True
+                    print(f"Matched template: {template_name} (using {os.path.basename(result.path)})")
                     
-                    # Check kill switch before each template matching operation
-                    check_kill_switch()
+                    # Display the results only if visualizer is enabled
+                    if config.get('visualizer_enabled', True):
+                        display_results(frame.canvas(), result.coordinates, match_results, template_name, selected_monitor)
                     
-                    match_coordinates, match_results = template_matcher.match_template(screenshot)
+                    # Perform actions based on the match and get updated frame
+                    frame = perform_actions(
+                        frame, 
+                        result.coordinates, 
+                        template_actions.get(result.path, []),
+                        action_performer,
+                        template_settle.get(result.path)
+                    )
                     
-                    if match_coordinates:
-                        template_matched = True
-                        match_found = True
-                        print(f"Matched template: {template_name} (using {os.path.basename(path)})")
-                        
-                        # Display the results only if visualizer is enabled
-                        if config.get('visualizer_enabled', True):
-                            display_results(screenshot, match_coordinates, match_results, template_name, selected_monitor)
-                        
-                        # Perform actions based on the match and get updated screenshot
-                        screenshot = perform_actions(
-                            screenshot_path, 
-                            match_coordinates, 
-                            template_actions.get(path, []),
-                            action_performer,
-                            screenshots_dir
-                        )
-                        
-                        # Add this template's name to executed templates
-                        executed_template_names.add(template_name)
-                        
-                        break  # Exit the path loop once a match is found
+                    # The frame changed, so results for the remaining templates have to be recomputed
+                    frame_results = {}
+                    
+                    # Add this template's name to executed templates
+                    executed_template_names.add(template_name)
                 
                 # If none of the paths matched
-                if not match_found:
+                else:
                     print(f"No match found for template: {template_name}")
                     if config.get('visualizer_enabled', True) and config.get('show_failed_matches', False):
                         # Optionally show failed matches
-                        display_results(screenshot, None, match_results, template_name, selected_monitor)
+                        display_results(frame.canvas(), None, match_results, template_name, selected_monitor)
                 
                 # Break after the first template is matched and actions are performed
                 if match_found and config.get('process_one_template_per_iteration', True):
                     break
             
+            report_stage_timings()
+            
             # Stop the program if a disabled template was encountered or a dependency failed
             if stop_after_current:
                 print("Stopping program due to disabled template or dependency failure")
@@ -401,20 +556,26 @@ def main():
         print("\nProgram terminated by user.")
     finally:
         # Clean up resources
+        template_bank.close()
+        if template_cache is not None:
+            template_cache.close()
+        capture_session.close()
+        if frame_sink is not None:
+            frame_sink.close()
         keyboard.unhook_all()
         print("Program terminated.")
 
-def perform_actions(screenshot_path, match_coordinates, actions, action_performer, screenshots_dir):
+def perform_actions(frame, match_coordinates, actions, action_performer, settle=None):
     """
     Execute actions defined in the config for a matched template.
-    Captures a new screenshot after click or double-click actions.
-    Returns the latest screenshot.
+    Captures a new screenshot after click or double-click actions, using the action's "settle" policy
+    if it has one, otherwise the template's (settle), otherwise the scenario default.
+    Returns the latest screenshot as a Frame (the matched frame if no action captured a new one).
     """
     x, y, w, h = match_coordinates
     center_x, center_y = x + w // 2, y + h // 2
     
-    # Use the current screenshot path for saving updated screenshots
-    current_screenshot = cv2.imread(screenshot_path)
+    current_screenshot = frame
     
     for action in actions:
         # Check kill switch before each action
@@ -427,33 +588,34 @@ def perform_actions(screenshot_path, match_coordinates, actions, action_performe
             elif action == "click":
                 action_performer.click()
                 # Capture a new screenshot after click
-                current_screenshot = capture_screenshot(screenshot_path)
+                current_screenshot = capture_screenshot(settle)
             elif action == "double_click":
                 action_performer.double_click()
                 # Capture a new screenshot after double-click
-                current_screenshot = capture_screenshot(screenshot_path)
+                current_screenshot = capture_screenshot(settle)
         
         # Handle dictionary action types (new format with parameters)
         elif isinstance(action, dict) and 'type' in action:
             action_type = action['type']
+            action_settle = action.get('settle', settle)
             
             if action_type == "move_mouse":
                 action_performer.move_mouse(center_x, center_y)
             elif action_type == "click":
                 action_performer.click(action.get('button', 'left'))
                 # Capture a new screenshot after click
-                current_screenshot = capture_screenshot(screenshot_path)
+                current_screenshot = capture_screenshot(action_settle)
             elif action_type == "double_click":
                 action_performer.double_click(action.get('button', 'left'))
                 # Capture a new screenshot after double-click
-                current_screenshot = capture_screenshot(screenshot_path)
+                current_screenshot = capture_screenshot(action_settle)
             elif action_type == "type_message":
                 action_performer.type_message(action.get('message', ''))
             elif action_type == "press_key":
                 action_performer.press_key(action.get('key', 'enter'))
                 # Capture a new screenshot after pressing enter as it might change the screen
                 if action.get('key', '') in ['enter', 'return']:
-                    current_screenshot = capture_screenshot(screenshot_path)
+                    current_screenshot = capture_screenshot(action_settle)
             elif action_type == "wait":
                 seconds = action.get('seconds', 1)
                 # Break the wait into smaller chunks to check kill switch more frequently
@@ -0,0 +1,94 @@
+import numpy as np
+
+class MatchResult:
+    """
+    Outcome of one TemplateMatcher.match_template call.
+    Method names, values and locations are kept as parallel arrays and the pairwise
+    distances between method locations are computed in one vectorized step.
+    Use to_dict() for the older string-keyed format (e.g. for the visualizer).
+    """
+    __slots__ = ('methods', 'method_ids', 'values', 'locations', 'distances', 'agreement',
+                 'threshold', 'distance_threshold', 'match_status', 'best_index', 'scale', 'pruned_fraction')
+
+    def __init__(self, methods, method_ids, values, locations, threshold, distance_threshold, match_status=""):
+        self.methods = tuple(methods)
+        self.method_ids = np.asarray(method_ids, dtype=np.int8)
+        self.values = np.asarray(values, dtype=np.float64)
+        self.locations = np.asarray(locations, dtype=np.int32).reshape(-1, 2)
+        self.threshold = threshold
+        self.distance_threshold = distance_threshold
+        self.match_status = match_status
+        self.best_index = -1  # Index of the method that produced the best match, -1 if none
+        self.scale = 1.0
+        self.pruned_fraction = 0.0  # Fraction of positions ruled out by the pre-filter
+
+        # Pairwise distances between all method locations and which pairs agree (within the threshold)
+        delta = self.locations[:, None, :] - self.locations[None, :, :]
+        self.distances = np.hypot(delta[..., 0], delta[..., 1])
+        self.agreement = self.distances <= distance_threshold
+        np.fill_diagonal(self.agreement, False)
+
+    @classmethod
+    def empty(cls, match_status, threshold, distance_threshold):
+        """Result of a search that could not run any method."""
+        return cls((), (), (), (), threshold, distance_threshold, match_status)
+
+    def __len__(self):
+        return len(self.methods)
+
+    def __repr__(self):
+        return f"MatchResult({self.match_status!r}, methods={list(self.methods)})"
+
+    @property
+    def normed_mask(self):
+        """Boolean array marking the normed methods."""
+        return np.array(['NORMED' in method for method in self.methods], dtype=bool)
+
+    @property
+    def threshold_failures(self):
+        """Normed methods whose value is below the match threshold."""
+        failing = self.normed_mask & (self.values < self.threshold)
+        return [method for method, failed in zip(self.methods, failing) if failed]
+
+    @property
+    def agreeing_method_count(self):
+        """Number of methods that agree with at least one other method."""
+        return int(self.agreement.any(axis=1).sum())
+
+    @property
+    def agreeing_methods(self):
+        """{method: set of methods whose location is within the distance threshold}."""
+        return {method: {self.methods[j] for j in np.flatnonzero(self.agreement[i])}
+                for i, method in enumerate(self.methods)}
+
+    @property
+    def best_method(self):
+        """Name of the method that produced the best match, None if there is no match."""
+        return self.methods[self.best_index] if self.best_index >= 0 else None
+
+    def value(self, method):
+        """Match value of a method (higher = better for every method)."""
+        return float(self.values[self.methods.index(method)])
+
+    def location(self, method):
+        """Frame-global (x, y) location found by a method."""
+        x, y = self.locations[self.methods.index(method)]
+        return int(x), int(y)
+
+    def to_dict(self):
+        """Per-method dicts plus distance_to_<method> keys and metadata, as match_template used to return."""
+        results = {}
+        for i, method in enumerate(self.methods):
+            entry = {'value': float(self.values[i]), 'location': self.location(method)}
+            for j, other in enumerate(self.methods):
+                if i != j:
+                    entry['distance_to_' + other] = float(self.distances[i, j])
+            results[method] = entry
+
+        results['match_status'] = self.match_status
+        results['threshold'] = self.threshold
+        results['distance_pixels_threshold'] = self.distance_threshold
+        results['agreeing_methods'] = self.agreeing_methods
+        results['scale'] = self.scale
+        results['pruned_fraction'] = self.pruned_fraction
+        return results
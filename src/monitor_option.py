@@ -1,7 +1,10 @@
 from mss import mss
 
-def get_monitors():
-    """Get a list of available monitors"""
+def get_monitors(capture_session=None):
+    """Get a list of available monitors, from the capture session's enumeration if one is running"""
+    if capture_session is not None:
+        return capture_session.monitors
+    
     with mss() as sct:
         monitors = sct.monitors
     
@@ -0,0 +1,153 @@
+"""
+Process-pool matching backend.
+
+Each worker process receives its share of the template matchers once at startup and keeps
+them loaded. Per frame, the grayscale capture is copied once into shared memory; workers
+map it without copying and only send back the small (coordinates, MatchResult) pairs.
+"""
+import multiprocessing
+import signal
+from multiprocessing import shared_memory
+import numpy as np
+from frame import Frame
+
+def worker_main(conn, matchers):
+    """Worker loop: match the requested template paths against the frame in shared memory."""
+    # Ctrl+C and the kill switch are handled by the parent, which shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    attached = {}  # shared memory name -> SharedMemory
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+
+            shm_name, shape, offset, monitor, geometry, paths = message
+            if shm_name not in attached:
+                for shm in attached.values():
+                    shm.close()
+                attached = {shm_name: shared_memory.SharedMemory(name=shm_name)}
+
+            gray = np.ndarray(shape, dtype=np.uint8, buffer=attached[shm_name].buf)
+            frame = Frame(gray, offset, monitor, geometry)
+
+            results = {}
+            for path in paths:
+                try:
+                    results[path] = matchers[path].match_template(frame)
+                except Exception as e:
+                    print(f"Error matching {path} in worker process: {e}")
+                    results[path] = (None, None)
+
+            # Drop the view before the next frame so the block can be closed
+            del frame, gray
+            conn.send(results)
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        for shm in attached.values():
+            shm.close()
+        # Worker processes exit without joining threads, so wait for template cache writes here
+        for matcher in matchers.values():
+            if matcher.template_cache is not None:
+                matcher.template_cache.close()
+        conn.close()
+
+class ProcessMatchBackend:
+    """Matches template paths in worker processes that hold their matchers permanently."""
+
+    def __init__(self, matchers, workers=2, frame=None):
+        """
+        Args:
+            matchers: {template path: matcher}, the matchers are pickled to the workers once
+            workers: Number of worker processes
+            frame: Optional first frame, published before the workers start
+        """
+        workers = max(1, min(int(workers or 1), len(matchers)))
+
+        # Creating the shared block before starting the workers makes them share the parent's
+        # resource tracker, so only the parent ever unlinks it
+        self.shm = None
+        if frame is not None:
+            self.publish(frame)
+
+        # Paths are assigned round-robin so every worker gets a similar share of templates
+        self.worker_paths = [[] for _ in range(workers)]
+        for i, path in enumerate(matchers):
+            self.worker_paths[i % workers].append(path)
+
+        self.connections = []
+        self.processes = []
+        for paths in self.worker_paths:
+            parent_conn, child_conn = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=worker_main,
+                args=(child_conn, {path: matchers[path] for path in paths}),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+
+        print(f"Process matching backend started with {workers} worker processes")
+
+    def publish(self, frame):
+        """Copy the frame's grayscale image into shared memory, reusing the block while the size fits."""
+        gray = np.ascontiguousarray(frame.gray)
+        if self.shm is None or self.shm.size < gray.nbytes:
+            self.release_shared_memory()
+            self.shm = shared_memory.SharedMemory(create=True, size=gray.nbytes)
+
+        shared = np.ndarray(gray.shape, dtype=np.uint8, buffer=self.shm.buf)
+        shared[...] = gray
+        del shared
+        return gray.shape
+
+    def match(self, frame, paths):
+        """Match the given template paths against the frame, returns {path: (coordinates, match_results)}."""
+        shape = self.publish(frame)
+        monitor = dict(frame.monitor) if frame.monitor else None
+        wanted = set(paths)
+
+        # Send to every involved worker first so they all work at the same time
+        busy = []
+        for conn, worker_paths in zip(self.connections, self.worker_paths):
+            requested = [path for path in worker_paths if path in wanted]
+            if requested:
+                conn.send((self.shm.name, shape, frame.offset, monitor, frame.monitor_key, requested))
+                busy.append(conn)
+
+        results = {}
+        for conn in busy:
+            results.update(conn.recv())
+        return results
+
+    def release_shared_memory(self):
+        """Free the shared frame block."""
+        if self.shm is not None:
+            self.shm.close()
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = None
+
+    def close(self, timeout=2.0):
+        """Stop the workers (terminating any that do not exit in time) and free shared memory."""
+        for conn in self.connections:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for process in self.processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join(timeout)
+        for conn in self.connections:
+            conn.close()
+        self.connections = []
+        self.processes = []
+        self.release_shared_memory()
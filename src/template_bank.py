@@ -0,0 +1,212 @@
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+from change_detector import ChangeDetector
+from frame import Frame
+from process_matcher import ProcessMatchBackend
+
+# Compact per-template outcome of TemplateBank.match_all
+# coordinates is (x, y, w, h) or None, path is the template file that produced the result
+TemplateResult = namedtuple('TemplateResult', ['name', 'path', 'coordinates', 'match_results'])
+
+class TemplateBank:
+    """
+    Owns every template matcher of a scenario and matches them against one frame per call.
+    Templates are addressed by name; a name can have several template paths, which are
+    tried in configuration order until one of them matches.
+    """
+
+    # Supported matching backends
+    BACKENDS = ('thread', 'process')
+
+    def __init__(self, max_workers=1, backend='thread', change_detection=True, change_block_size=32):
+        self.matchers = {}  # template path -> matcher
+        self.canonical = {}  # template path -> first path registered with the same matcher
+        self.shared = {}  # matcher share key -> (matcher, canonical path)
+        self.paths = {}  # template name -> list of template paths
+        self.names = []  # template names in configuration order
+
+        if backend not in self.BACKENDS:
+            print(f"Unknown matching backend '{backend}', using 'thread'")
+            backend = 'thread'
+        self.backend = backend
+        self.max_workers = max(1, int(max_workers or 1))
+
+        # Change detection: templates whose search area did not change since the previous frame
+        # reuse their last outcome instead of being matched again
+        self.change_detector = ChangeDetector(change_block_size) if change_detection else None
+        self.last_outcomes = {}  # template path -> (frame serial, (coordinates, match_results, ...)) of the last match
+        self.frame_serial = 0  # Counts the distinct frames passed to match_all
+        
+        # The process backend starts its workers on the first match, once every template is added
+        self.process_backend = None
+
+        # With more than one worker, template paths and their methods are matched on thread pools.
+        # Two pools are used so a template task waiting for its methods can never starve them.
+        self.template_pool = None
+        self.method_pool = None
+        if self.max_workers > 1 and self.backend == 'thread':
+            # The pools provide the parallelism, OpenCV's own threads would only oversubscribe the cores
+            cv2.setNumThreads(1)
+            self.template_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='match-template')
+            self.method_pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix='match-method')
+            print(f"Parallel matching enabled with {self.max_workers} workers")
+
+    def add(self, name, path, matcher):
+        """Register a matcher for one template path under the given template name."""
+        if name not in self.paths:
+            self.paths[name] = []
+            self.names.append(name)
+        self.paths[name].append(path)
+        
+        # Templates with identical pixels and settings share one matcher, which runs once per frame
+        key = matcher.share_key()
+        if key in self.shared:
+            matcher, canonical_path = self.shared[key]
+            if canonical_path != path:
+                print(f"Template {path} is identical to {canonical_path}, matching it once")
+        else:
+            canonical_path = path
+            self.shared[key] = (matcher, path)
+            matcher.executor = self.method_pool
+        self.matchers[path] = matcher
+        self.canonical[path] = canonical_path
+
+    @property
+    def parallel(self):
+        """Whether match_all runs the requested templates on worker threads or processes."""
+        return self.backend == 'process' or self.template_pool is not None
+
+    def __len__(self):
+        return len(self.matchers)
+
+    def search_regions(self, names):
+        """Search regions of every template path of the given names, None if any of them searches the whole frame."""
+        regions = []
+        for name in names:
+            for path in self.paths.get(name, []):
+                search_region = self.matchers[path].search_region
+                if search_region is None:
+                    return None
+                regions.append(search_region)
+        return regions
+
+    def close(self):
+        """Shut down the worker threads and processes."""
+        for pool in (self.template_pool, self.method_pool):
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+        self.template_pool = self.method_pool = None
+
+        if self.process_backend is not None:
+            self.process_backend.close()
+            self.process_backend = None
+            print("Process matching backend stopped")
+
+    def timed_match(self, path, frame):
+        """Match one template path and return (coordinates, match_results, CPU seconds)."""
+        matcher = self.matchers[path]
+        start = time.thread_time()
+        coordinates, match_results = matcher.match_template(frame)
+        # Methods that ran on the method pool report their CPU time separately
+        cpu_seconds = time.thread_time() - start + matcher.stats.get('pool_seconds', 0.0)
+        return coordinates, match_results, cpu_seconds
+
+    def match_all(self, frame, names=None):
+        """
+        Match the given template names (all templates if None) against a single frame.
+        Returns {name: TemplateResult} in the order the names were requested.
+        """
+        # One frame for the whole call, so every preprocessing step is shared between templates
+        frame = Frame.from_source(frame)
+        names = self.names if names is None else names
+        paths = [path for name in names for path in self.paths.get(name, [])]
+        
+        # Results of templates whose whole search area is unchanged since the last frame are reused
+        outcomes = self.unchanged_outcomes(frame, paths)
+        
+        # Only one path per shared matcher is matched, the others take its outcome in select_results
+        pending = list(dict.fromkeys(self.canonical[path] for path in paths if path not in outcomes))
+        if self.backend == 'process':
+            outcomes.update(self.match_paths_processes(frame, pending))
+        elif self.template_pool is not None:
+            outcomes.update(self.match_paths_parallel(frame, pending))
+        
+        # Sequential matching happens lazily, so later paths of a name are skipped once one matches
+        results = self.select_results(names, outcomes, frame)
+        self.last_outcomes.update((path, (self.frame_serial, outcome)) for path, outcome in outcomes.items())
+        return results
+
+    def unchanged_outcomes(self, frame, paths):
+        """
+        {path: previous outcome} of the paths whose search area lies entirely in unchanged blocks.
+        Only outcomes of this frame or of the frame the detector compared it with can be reused;
+        a path that was not matched on the previous frame may have changed since its outcome was computed.
+        """
+        if self.change_detector is None:
+            return {}
+        
+        if frame is not self.change_detector.previous:
+            self.frame_serial += 1
+        self.change_detector.update(frame)
+        outcomes = {}
+        for path in paths:
+            if path not in self.last_outcomes:
+                continue
+            serial, outcome = self.last_outcomes[path]
+            if serial == self.frame_serial or (serial == self.frame_serial - 1 and
+                                               self.change_detector.is_clean(self.matchers[path].search_area(frame))):
+                outcomes[path] = outcome
+        
+        if outcomes:
+            dirty_count = len(self.change_detector.dirty_rectangles())
+            print(f"Reused {len(outcomes)} of {len(paths)} template results, {dirty_count} changed screen regions")
+        return outcomes
+
+    def select_results(self, names, outcomes, frame=None):
+        """
+        Pick each name's result: the first matching path in configuration order wins.
+        outcomes maps paths to (coordinates, match_results, ...) tuples; paths missing from it are
+        matched against the frame on demand and added to it.
+        """
+        results = {}
+        for name in names:
+            result = None
+            for path in self.paths.get(name, []):
+                if path not in outcomes:
+                    canonical_path = self.canonical[path]
+                    if canonical_path not in outcomes:
+                        outcomes[canonical_path] = self.matchers[canonical_path].match_template(frame)
+                    outcomes[path] = outcomes[canonical_path]
+                coordinates, match_results = outcomes[path][:2]
+                result = TemplateResult(name, path, coordinates, match_results)
+                if coordinates:
+                    break  # First matching path wins, like the per-path loop did
+            results[name] = result
+        return results
+
+    def match_paths_processes(self, frame, paths):
+        """Match paths on the worker processes, which share the frame through shared memory."""
+        if not paths:
+            return {}
+        if self.process_backend is None:
+            canonical_matchers = {path: matcher for path, matcher in self.matchers.items() if self.canonical[path] == path}
+            self.process_backend = ProcessMatchBackend(canonical_matchers, self.max_workers, frame)
+        return self.process_backend.match(frame, paths)
+
+    def match_paths_parallel(self, frame, paths):
+        """Match every path on the thread pools, returns {path: (coordinates, match_results, CPU seconds)}."""
+        if not paths:
+            return {}
+        start = time.perf_counter()
+        futures = {path: self.template_pool.submit(self.timed_match, path, frame) for path in paths}
+        outcomes = {path: future.result() for path, future in futures.items()}
+        
+        # The CPU time of all work items approximates what a sequential run would take
+        busy_seconds = sum(seconds for _, _, seconds in outcomes.values())
+        wall_seconds = time.perf_counter() - start
+        if wall_seconds > 0:
+            print(f"Matched {len(futures)} template paths on {self.max_workers} workers in {wall_seconds * 1000:.1f} ms "
+                  f"(sequential {busy_seconds * 1000:.1f} ms, speedup {busy_seconds / wall_seconds:.1f}x)")
+        return outcomes
@@ -0,0 +1,183 @@
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+
+class TemplateCache:
+    """
+    On-disk cache of decoded templates and the data derived from them.
+    Entries are stored as plain .npy files in a directory named after the content hash of the
+    template file, so they can be memory-mapped instead of decoded. An index maps every template
+    path to its (mtime, size, hash); a template is only re-read and re-decoded when its file changed.
+
+    Layout:
+        <cache_dir>/index.json
+        <cache_dir>/<hash>/template.npy       decoded grayscale template
+        <cache_dir>/<hash>/pyramid_<n>.npy    pyrDown level n (n >= 1)
+        <cache_dir>/<hash>/norms.npy          [sum, squared sum] of the template pixels
+        <cache_dir>/<hash>/spectrum_<h>x<w>.npy  FFT engine spectrum for a DFT size
+    """
+
+    INDEX_FILE = 'index.json'
+
+    # Spectra depend on the frame size, only this many sizes are kept per template
+    MAX_SPECTRA = 4
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writer = None  # Background thread writing spectra, started on the first one
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self.load_index()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        state['writer'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def close(self):
+        """Wait for the spectra still being written."""
+        if self.writer is not None:
+            self.writer.shutdown(wait=True)
+            self.writer = None
+
+    def load_index(self):
+        """Read the path -> {mtime_ns, size, hash} index, an unreadable index just starts empty."""
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        try:
+            with open(index_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        # Write to a temporary file first so an interrupted run never leaves a broken index
+        index_path = os.path.join(self.cache_dir, self.INDEX_FILE)
+        temp_path = index_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(temp_path, index_path)
+
+    def entry_dir(self, content_hash):
+        return os.path.join(self.cache_dir, content_hash)
+
+    def load(self, template_path):
+        """
+        Return (content hash, grayscale template) for a template file.
+        The template is memory-mapped from the cache when the file is unchanged, otherwise it is
+        decoded once and stored under the hash of the file contents.
+        """
+        key = os.path.abspath(template_path)
+        stat = os.stat(template_path)
+        with self.lock:
+            entry = self.index.get(key)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                template = self.read_array(entry['hash'], 'template')
+                if template is not None:
+                    self.hits += 1
+                    return entry['hash'], template
+
+            # File changed (or was never cached): hash its bytes, identical content reuses the entry
+            with open(template_path, 'rb') as f:
+                data = f.read()
+            content_hash = hashlib.blake2b(data, digest_size=16).hexdigest()
+            template = self.read_array(content_hash, 'template')
+            if template is None:
+                self.misses += 1
+                template = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+                if template is None:
+                    raise FileNotFoundError(f"Could not load template: {template_path}")
+                self.write_array(content_hash, 'template', template)
+            else:
+                self.hits += 1
+
+            self.index[key] = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'hash': content_hash}
+            self.save_index()
+            return content_hash, template
+
+    def read_array(self, content_hash, name):
+        """Memory-map a cached array, None if it is missing or unreadable."""
+        array_path = os.path.join(self.entry_dir(content_hash), name + '.npy')
+        if not os.path.exists(array_path):
+            return None
+        try:
+            return np.load(array_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def write_array(self, content_hash, name, array):
+        """Store an array of a cache entry, failures only cost the cache (e.g. read-only disk)."""
+        entry_dir = self.entry_dir(content_hash)
+        array_path = os.path.join(entry_dir, name + '.npy')
+        temp_path = os.path.join(entry_dir, name + '.tmp.npy')
+        try:
+            os.makedirs(entry_dir, exist_ok=True)
+            np.save(temp_path, np.ascontiguousarray(array))
+            os.replace(temp_path, array_path)
+        except OSError as e:
+            print(f"Warning: Could not write template cache {array_path}: {e}")
+
+    def pyramid(self, content_hash, template, levels):
+        """[template, level 1, ..., level `levels`], missing levels are computed and stored."""
+        pyramid = [template]
+        for level in range(1, levels + 1):
+            cached = self.read_array(content_hash, f'pyramid_{level}')
+            if cached is None:
+                cached = cv2.pyrDown(pyramid[-1])
+                self.write_array(content_hash, f'pyramid_{level}', cached)
+            pyramid.append(cached)
+        return pyramid
+
+    def norms(self, content_hash, template):
+        """(sum, squared sum) of the template pixels."""
+        cached = self.read_array(content_hash, 'norms')
+        if cached is None:
+            template_f64 = np.asarray(template, dtype=np.float64)
+            cached = np.array([template_f64.sum(), (template_f64 * template_f64).sum()])
+            self.write_array(content_hash, 'norms', cached)
+        return float(cached[0]), float(cached[1])
+
+    def spectra(self, content_hash):
+        """{(dft_h, dft_w): spectrum} of every spectrum stored for the template."""
+        entry_dir = self.entry_dir(content_hash)
+        spectra = {}
+        try:
+            names = sorted(os.listdir(entry_dir))
+        except OSError:
+            return spectra
+        for file_name in names:
+            if file_name.startswith('spectrum_') and file_name.endswith('.npy') and '.tmp' not in file_name:
+                name = file_name[:-len('.npy')]
+                dft_h, dft_w = (int(size) for size in name[len('spectrum_'):].split('x'))
+                spectrum = self.read_array(content_hash, name)
+                if spectrum is not None:
+                    spectra[(dft_h, dft_w)] = spectrum
+        return spectra
+
+    def store_spectrum(self, content_hash, dft_h, dft_w, spectrum):
+        """Persist a spectrum computed by the FFT engine in the background, up to MAX_SPECTRA sizes per template."""
+        # A full-screen spectrum is tens of megabytes, writing it must not hold up matching
+        with self.lock:
+            if self.writer is None:
+                self.writer = ThreadPoolExecutor(1, thread_name_prefix='template-cache')
+        self.writer.submit(self.write_spectrum, content_hash, dft_h, dft_w, spectrum)
+
+    def write_spectrum(self, content_hash, dft_h, dft_w, spectrum):
+        with self.lock:
+            try:
+                stored = [name for name in os.listdir(self.entry_dir(content_hash))
+                          if name.startswith('spectrum_') and '.tmp' not in name]
+            except OSError:
+                stored = []
+            if len(stored) < self.MAX_SPECTRA:
+                self.write_array(content_hash, f'spectrum_{dft_h}x{dft_w}', spectrum)
@@ -1,6 +1,14 @@
 import cv2
 import numpy as np
+import hashlib
+import itertools
 import math
+import os
+import threading
+import time
+from collections import deque
+from frame import Frame
+from match_result import MatchResult
 
 class TemplateMatcher:
     # Define all available template matching methods
@@ -13,131 +21,1121 @@ class TemplateMatcher:
         'TM_SQDIFF_NORMED': cv2.TM_SQDIFF_NORMED
     }
     
-    def __init__(self, template_path, methods=None, threshold=0.8, distance_pixels_threshold=50):
-        self.template = self.load_template(template_path)
-        self.template_h, self.template_w = self.template.shape
+    # Methods where the best match is the minimum value of the result map
+    SQDIFF_METHODS = (cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED)
+    
+    # Smallest template side (in pixels) still worth matching at a coarse pyramid level
+    MIN_PYRAMID_TEMPLATE_SIZE = 8
+    
+    # Matching engines: direct spatial correlation, frequency domain correlation, pick per call,
+    # or keypoint matching (rotation/scale tolerant, replaces the methods)
+    ENGINES = ('direct', 'fft', 'auto', 'orb', 'akaze')
+    KEYPOINT_ENGINES = ('orb', 'akaze')
+    
+    # Adaptive methods: number of recorded decisions kept, and how close (pixels) a method subset's
+    # match has to be to the full decision to count as reproducing it
+    ADAPTIVE_HISTORY = 50
+    ADAPTIVE_LOCATION_TOLERANCE = 2
+    
+    # Keypoint engine: ORB features per frame, ORB patch size (small enough for icon sized templates),
+    # Lowe ratio test and RANSAC reprojection error in pixels
+    KEYPOINT_FEATURES = 20000
+    KEYPOINT_PATCH_SIZE = 15
+    KEYPOINT_RATIO = 0.75
+    KEYPOINT_RANSAC_THRESHOLD = 5.0
+    
+    # Orderings supported by find_all
+    INSTANCE_ORDERS = ('score', 'top_to_bottom', 'left_to_right')
+    
+    # Boxes overlapping a better instance by more than this fraction (IoU) are suppressed by find_all
+    NMS_OVERLAP = 0.3
+    
+    # Normed methods from cheapest to most expensive, the order used by the cascade mode
+    CASCADE_ORDER = ('TM_CCORR_NORMED', 'TM_SQDIFF_NORMED', 'TM_CCOEFF_NORMED')
+    
+    # Relative cost of one FFT element operation vs one direct multiply-add, used by the 'auto' engine.
+    # cv2.matchTemplate already correlates large templates blockwise in the frequency domain, so the
+    # FFT engine only pays off for very large templates (calibrated on 1080p and 4K frames)
+    FFT_COST_FACTOR = 8000.0
+    
+    # Pre-filter: surviving positions are grouped on a grid of blocks this many positions wide, and when
+    # the resulting sub-frames cover more than this fraction of the frame the whole frame is correlated
+    PREFILTER_BLOCK = 32
+    PREFILTER_FULL_FRAME = 0.5
+    
+    def __init__(self, template_path, methods=None, threshold=0.8, distance_pixels_threshold=50,
+                 pyramid_levels=0, pyramid_candidates=3, engine='direct', search_region=None, hint_padding=0,
+                 scales=None, cascade=False, instance_index=None, instance_order='score', max_instances=10,
+                 template_cache=None, prefilter=False, prefilter_mean_tolerance=30.0, prefilter_std_tolerance=30.0,
+                 last_hit_max_age=5.0, keypoint_min_inliers=10, adaptive_methods=False, adaptive_warmup=20,
+                 adaptive_audit_interval=10, combined=False):
+        # Optional TemplateCache: the decoded template and its derived data are memory-mapped from disk
+        self.template_cache = template_cache
+        self.content_hash = None
+        self.original_template = self.load_template(template_path)
         self.threshold = threshold
         self.distance_threshold = distance_pixels_threshold
         
+        self.template_path = template_path
+        
         # Use specified methods or all methods if none provided
         self.methods = methods if methods else list(self.METHODS.keys())
         
+        # Combined mode: one cross-correlation and one set of window sums per search, every method's
+        # map is derived from them
+        self.combined = bool(combined)
+        self.combined_cache = {}  # (frame id, scale) -> (frame, parts) during a search
+        
+        # Adaptive methods: after adaptive_warmup searches with every method, only the smallest method
+        # subset that reproduces the recorded decisions runs. Every adaptive_audit_interval-th search
+        # runs all methods again, records its decision and re-evaluates the subset to catch drift.
+        self.adaptive_methods = bool(adaptive_methods)
+        self.adaptive_warmup = max(1, int(adaptive_warmup or 1))
+        self.adaptive_audit_interval = max(1, int(adaptive_audit_interval or 1))
+        self.method_history = deque(maxlen=max(self.ADAPTIVE_HISTORY, self.adaptive_warmup))
+        self.method_agreement = {}  # method -> [searches agreeing with the decision, recorded searches]
+        self.active_methods = None  # None until the warm-up is over
+        self.searches_since_audit = 0
+        
+        # Cascade mode: stop at the first normed method below the threshold
+        self.cascade = bool(cascade)
+        
+        # Pre-filter: positions whose window mean/std differ from the template's by more than the
+        # tolerances (gray levels) are ruled out before correlation (full-resolution searches only)
+        self.prefilter = bool(prefilter)
+        self.prefilter_mean_tolerance = float(prefilter_mean_tolerance)
+        self.prefilter_std_tolerance = float(prefilter_std_tolerance)
+        self.prefilter_cache = None  # (frame, scale, (pruned fraction, windows)) of the last frame
+        
+        # Coarse-to-fine search: 0 levels disables the pyramid and matches at full resolution
+        self.pyramid_levels = max(0, int(pyramid_levels or 0))
+        self.pyramid_candidates = max(1, int(pyramid_candidates or 1))
+        
+        # Correlation engine used for full-frame result maps, or a keypoint engine
+        if engine not in self.ENGINES:
+            print(f"Unknown matching engine '{engine}', using 'direct'")
+            engine = 'direct'
+        if engine == 'akaze' and not hasattr(cv2, 'AKAZE_create'):
+            print("AKAZE is not available in this OpenCV build, using 'orb'")
+            engine = 'orb'
+        self.engine = engine
+        
+        # Optional fixed search area [x, y, width, height] in frame-global coordinates
+        self.search_region = tuple(search_region) if search_region else None
+        
+        # Last-hit hint: search a window padded by hint_padding pixels around the previous match first
+        self.hint_padding = max(0, int(hint_padding or 0))
+        self.last_hit = None
+        
+        # Last-hit fingerprint: while the pixels of the last hit are unchanged the previous result is
+        # reused without searching, for at most last_hit_max_age seconds (0 disables the fingerprint)
+        self.last_hit_max_age = max(0.0, float(last_hit_max_age or 0.0))
+        self.last_fingerprint = None
+        
+        # Multi-instance mode: report the Nth instance found by find_all instead of the single best match
+        if instance_order not in self.INSTANCE_ORDERS:
+            print(f"Unknown instance order '{instance_order}', using 'score'")
+            instance_order = 'score'
+        self.instance_index = None if instance_index is None else int(instance_index)
+        self.instance_order = instance_order
+        self.max_instances = max(1, int(max_instances or 1))
+        
+        # Optional thread pool (set by TemplateBank) used to run the methods of one call in parallel
+        self.executor = None
+        self.lock = threading.RLock()
+        
+        # Per-call statistics, e.g. pool_seconds = CPU time the last call spent on pool threads
+        # prefilter_pruned = fraction of positions the pre-filter ruled out in the last search
+        # fingerprint_hit = whether the last call reused the previous result because its patch was unchanged
+        # buffer_bytes / peak_buffer_bytes = current and largest memory held by the result map buffers
+        self.stats = {'pool_seconds': 0.0, 'prefilter_pruned': 0.0, 'fingerprint_hit': False,
+                      'buffer_bytes': 0, 'peak_buffer_bytes': 0}
+        
+        # Per-method cv2.matchTemplate output buffers, dropped when the monitor geometry changes
+        self.result_buffers = {}
+        self.buffer_geometry = None
+        
+        # Keypoint engine: template keypoints are computed once, a match needs keypoint_min_inliers inliers
+        self.keypoint_min_inliers = max(4, int(keypoint_min_inliers or 4))
+        self.template_features = None
+        if self.engine in self.KEYPOINT_ENGINES:
+            self.template_features = self.create_detector(self.engine).detectAndCompute(self.original_template, None)
+            keypoints, descriptors = self.template_features
+            self.template_features = (np.float32([keypoint.pt for keypoint in keypoints]).reshape(-1, 2), descriptors)
+            if len(keypoints) < self.keypoint_min_inliers:
+                print(f"Warning: Template {template_path} has only {len(keypoints)} keypoints, "
+                      f"the {self.engine} engine needs at least {self.keypoint_min_inliers}")
+        
+        # Multi-scale matching: scales to try and the winning scale per monitor geometry
+        # Keypoint matching is scale invariant, so it only uses the original template
+        if self.engine in self.KEYPOINT_ENGINES:
+            scales = None
+        self.scales = [float(scale) for scale in scales] if scales else [1.0]
+        self.scale_cache = {}
+        self.scaled_templates = {}  # scale -> template data derived for that scale
+        self.set_scale(1.0 if 1.0 in self.scales else self.scales[0])
+        
+    def __getstate__(self):
+        """Pickle support (used to hand matchers to worker processes), thread objects are not copied."""
+        state = self.__dict__.copy()
+        state['executor'] = None
+        state['prefilter_cache'] = None
+        state['combined_cache'] = {}
+        state['result_buffers'] = {}
+        state['buffer_geometry'] = None
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    def share_key(self):
+        """
+        Hashable identity of what this matcher computes: the template pixels plus every setting that
+        affects the result. Matchers with equal keys return the same result for every frame.
+        """
+        pixels = np.ascontiguousarray(self.original_template)
+        settings = (tuple(self.methods), self.threshold, self.distance_threshold, self.cascade,
+                    self.prefilter, self.prefilter_mean_tolerance, self.prefilter_std_tolerance,
+                    self.pyramid_levels, self.pyramid_candidates, self.engine, self.search_region,
+                    self.hint_padding, self.last_hit_max_age, self.instance_index, self.instance_order,
+                    self.max_instances, self.keypoint_min_inliers, tuple(self.scales), self.adaptive_methods,
+                    self.adaptive_warmup, self.adaptive_audit_interval, self.combined)
+        return hashlib.blake2b(pixels, digest_size=16).hexdigest(), pixels.shape, settings
+
+    @staticmethod
+    def scales_from_range(scale_range, steps=5):
+        """Evenly spaced scale factors covering [min, max] of a scale range, e.g. [1.0, 1.5]."""
+        if not scale_range:
+            return [1.0]
+        low, high = float(scale_range[0]), float(scale_range[-1])
+        steps = max(1, int(steps)) if high != low else 1
+        return [round(float(scale), 3) for scale in np.linspace(low, high, steps)]
+
+    def set_scale(self, scale):
+        """Make the template resized by `scale` the active template (derived data is built once per scale)."""
+        if scale == 1.0 and scale not in self.scaled_templates and self.content_hash is not None:
+            self.scaled_templates[scale] = self.cached_template_data(self.original_template)
+        
+        if scale not in self.scaled_templates:
+            if scale == 1.0:
+                template = self.original_template
+            else:
+                original_h, original_w = self.original_template.shape
+                size = (max(1, int(round(original_w * scale))), max(1, int(round(original_h * scale))))
+                interpolation = cv2.INTER_AREA if scale < 1.0 else cv2.INTER_LINEAR
+                template = cv2.resize(self.original_template, size, interpolation=interpolation)
+            
+            template_f64 = template.astype(np.float64)
+            self.scaled_templates[scale] = {
+                'template': template,
+                'pyramid': self.build_pyramid(template, self.pyramid_levels),
+                'sum': float(template_f64.sum()),
+                'sqsum': float((template_f64 * template_f64).sum()),
+                'spectra': {}  # (dft_h, dft_w) -> spectrum of the padded template, used by the FFT engine
+            }
+        
+        data = self.scaled_templates[scale]
+        self.scale = scale
+        self.template = data['template']
+        self.template_h, self.template_w = self.template.shape
+        self.template_pyramid = data['pyramid']
+        self.template_sum = data['sum']
+        self.template_sqsum = data['sqsum']
+        self.template_spectra = data['spectra']
+
+    def cached_template_data(self, template):
+        """Derived data of the unscaled template, read from (and completed in) the template cache."""
+        template_sum, template_sqsum = self.template_cache.norms(self.content_hash, template)
+        return {
+            'template': template,
+            'pyramid': self.template_cache.pyramid(self.content_hash, template, self.pyramid_levels),
+            'sum': template_sum,
+            'sqsum': template_sqsum,
+            'spectra': self.template_cache.spectra(self.content_hash)
+        }
+
     def load_template(self, template_path):
+        if self.template_cache is not None:
+            self.content_hash, template = self.template_cache.load(template_path)
+            return template
+        
         template = cv2.imread(template_path, cv2.IMREAD_GRAYSCALE)
         if template is None:
             raise FileNotFoundError(f"Could not load template: {template_path}")
         return template
 
-    def calculate_distance(self, point1, point2):
-        """Calculate Euclidean distance between two points."""
-        return math.sqrt((point1[0] - point2[0])**2 + (point1[1] - point2[1])**2)
+    def build_pyramid(self, image, levels):
+        """Return [image, image/2, image/4, ...] with `levels` downscaled entries."""
+        pyramid = [image]
+        for _ in range(levels):
+            pyramid.append(cv2.pyrDown(pyramid[-1]))
+        return pyramid
+
+    def best_in_result(self, result, method, mask=None):
+        """Return (value, location) of the best match in a result map (restricted to a mask), higher value = better."""
+        min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result, mask)
+        
+        # For SQDIFF methods, the best match is the minimum value
+        if method in self.SQDIFF_METHODS:
+            match_value = 1.0 - min_val if method == cv2.TM_SQDIFF_NORMED else -min_val
+            return match_value, min_loc
+        return max_val, max_loc
+
+    def match_method(self, frame, method_name):
+        """Run a single matching method on a frame and return (value, location)."""
+        method = self.METHODS.get(method_name)
+        
+        if self.pyramid_levels > 0:
+            return self.match_pyramid(frame, method)
+        if self.prefilter:
+            return self.match_prefiltered(frame, method)
+        
+        result = self.correlate(frame, method)
+        return self.best_in_result(result, method)
+
+    def result_buffer(self, method, image_shape, template_shape):
+        """
+        Reusable float32 output map for cv2.matchTemplate.
+        Each method owns one flat buffer that only grows, so the full frame, search regions and hint
+        windows all reuse it; methods running in parallel never share a buffer.
+        """
+        result_h = image_shape[0] - template_shape[0] + 1
+        result_w = image_shape[1] - template_shape[1] + 1
+        size = result_h * result_w
+        buffer = self.result_buffers.get(method)
+        if buffer is None or buffer.size < size:
+            with self.lock:
+                buffer = np.empty(size, dtype=np.float32)
+                self.result_buffers[method] = buffer
+                buffer_bytes = sum(method_buffer.nbytes for method_buffer in self.result_buffers.values())
+                self.stats['buffer_bytes'] = buffer_bytes
+                self.stats['peak_buffer_bytes'] = max(self.stats['peak_buffer_bytes'], buffer_bytes)
+        return buffer[:size].reshape(result_h, result_w)
+
+    def match_into_buffer(self, image, template, method):
+        """cv2.matchTemplate writing into the method's reusable result buffer (valid until the next call)."""
+        return cv2.matchTemplate(image, template, method, result=self.result_buffer(method, image.shape, template.shape))
+
+    def dft_size(self, frame):
+        """Padded DFT size used for a frame, large enough that valid positions never wrap around."""
+        frame_h, frame_w = frame.shape
+        return cv2.getOptimalDFTSize(frame_h), cv2.getOptimalDFTSize(frame_w)
+
+    def use_fft(self, frame):
+        """Decide whether the FFT engine is cheaper than direct correlation for this frame."""
+        if self.engine != 'auto':
+            return self.engine == 'fft'
+        
+        frame_h, frame_w = frame.shape
+        direct_cost = (frame_h - self.template_h + 1) * (frame_w - self.template_w + 1) * self.template_h * self.template_w
+        
+        # The frame spectrum is shared between templates, so only the product and inverse transform count
+        dft_h, dft_w = self.dft_size(frame)
+        fft_cost = self.FFT_COST_FACTOR * dft_h * dft_w * math.log2(dft_h * dft_w)
+        return fft_cost < direct_cost
+
+    def correlate(self, frame, method):
+        """Full-frame result map for one method, using the configured correlation engine."""
+        if self.combined:
+            return self.derive_method_map(method, *self.combined_parts(frame))
+        if self.use_fft(frame):
+            return self.fft_match_template(frame, method)
+        return self.match_into_buffer(frame.gray, self.template, method)
 
-    def match_template(self, screenshot_path):
-        # Can accept either a path or a pre-loaded image
-        if isinstance(screenshot_path, str):
-            screenshot = cv2.imread(screenshot_path, cv2.IMREAD_GRAYSCALE)
-            if screenshot is None:
-                raise FileNotFoundError(f"Could not load screenshot: {screenshot_path}")
+    def template_spectrum(self, dft_h, dft_w, persist=False):
+        """
+        Spectrum of the template zero-padded to the frame DFT size, cached per screen size.
+        With persist the spectrum is also stored in the template cache; only whole-screen sizes are worth
+        keeping there, search regions and hint windows change from frame to frame.
+        """
+        key = (dft_h, dft_w)
+        with self.lock:
+            if key not in self.template_spectra:
+                # Search regions and hint windows use their own sizes, keep only the most recent few
+                if len(self.template_spectra) >= 4:
+                    self.template_spectra.pop(next(iter(self.template_spectra)))
+                padded = np.zeros((dft_h, dft_w), dtype=np.float64)
+                padded[:self.template_h, :self.template_w] = self.template
+                self.template_spectra[key] = cv2.dft(padded, nonzeroRows=self.template_h)
+                if persist and self.content_hash is not None and self.scale == 1.0:
+                    self.template_cache.store_spectrum(self.content_hash, dft_h, dft_w, self.template_spectra[key])
+            return self.template_spectra[key]
+
+    def window_sums(self, frame):
+        """Sum and squared sum (float64) of the frame pixels under the template at every valid position."""
+        frame_h, frame_w = frame.shape
+        result_h, result_w = frame_h - self.template_h + 1, frame_w - self.template_w + 1
+        size = (self.template_w, self.template_h)
+        
+        # Unnormalised box filters are exact running sums, the same values as four-corner lookups in
+        # integral images but about three times faster than doing those lookups in numpy
+        window_sum = cv2.boxFilter(frame.gray, cv2.CV_64F, size, normalize=False, anchor=(0, 0),
+                                   borderType=cv2.BORDER_CONSTANT)[:result_h, :result_w]
+        window_sqsum = cv2.sqrBoxFilter(frame.gray, cv2.CV_64F, size, normalize=False, anchor=(0, 0),
+                                        borderType=cv2.BORDER_CONSTANT)[:result_h, :result_w]
+        return window_sum, window_sqsum
+
+    def fft_cross_correlation(self, frame):
+        """Raw cross-correlation (TM_CCORR map, float64) computed in the frequency domain."""
+        frame_h, frame_w = frame.shape
+        result_h, result_w = frame_h - self.template_h + 1, frame_w - self.template_w + 1
+        
+        dft_h, dft_w = self.dft_size(frame)
+        template_spectrum = self.template_spectrum(dft_h, dft_w, persist=frame.covers_screen)
+        product = cv2.mulSpectrums(frame.spectrum(dft_h, dft_w), template_spectrum, 0, conjB=True)
+        ccorr = cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT, nonzeroRows=result_h)
+        return ccorr[:result_h, :result_w]
+
+    @staticmethod
+    def flat_windows(window_energy, window_sqsum):
+        """Flat indices of the windows cv2.matchTemplate treats as flat (t = 0) to avoid rounding errors."""
+        candidates = np.flatnonzero(window_energy <= 0.5)
+        limit = 10 * np.finfo(np.float32).eps * window_sqsum.flat[candidates]
+        return candidates[window_energy.flat[candidates] <= limit]
+
+    def method_terms(self, window_sum, window_sqsum, methods):
+        """Window norms (and their flat windows) needed to normalise the given methods, shared between them."""
+        terms = {}
+        if cv2.TM_CCORR_NORMED in methods or cv2.TM_SQDIFF_NORMED in methods:
+            terms['window_norm'] = cv2.sqrt(window_sqsum)
+            terms['window_flat'] = self.flat_windows(window_sqsum, window_sqsum)
+        if cv2.TM_CCOEFF_NORMED in methods:
+            # Window energy around the window mean: sqsum - sum^2 / n
+            pixel_count = self.template_h * self.template_w
+            window_energy = cv2.subtract(window_sqsum, cv2.multiply(window_sum, window_sum, scale=1.0 / pixel_count))
+            np.maximum(window_energy, 0.0, out=window_energy)
+            terms['coeff_norm'] = cv2.sqrt(window_energy)
+            terms['coeff_flat'] = self.flat_windows(window_energy, window_sqsum)
+        return terms
+
+    def normalize_map(self, numerator, window_norm, flat, template_norm, method):
+        """
+        numerator / (window_norm * template_norm) with the clamping rules of cv2.matchTemplate:
+        |num| < t gives num / t, |num| < 1.125 t gives sign(num), anything else (and flat windows, t = 0)
+        gives 1 for TM_SQDIFF_NORMED and 0 otherwise.
+        """
+        outside = 1.0 if method == cv2.TM_SQDIFF_NORMED else 0.0
+        if template_norm <= 0:
+            return np.full(numerator.shape, outside, dtype=np.float32)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            normed = cv2.divide(numerator, window_norm, scale=1.0 / template_norm).astype(np.float32)
+        normed.flat[flat] = outside
+        
+        # SQDIFF numerators are never negative, so every clamped position becomes 1
+        if method == cv2.TM_SQDIFF_NORMED:
+            return np.minimum(normed, 1.0, out=normed)
+        
+        # Elsewhere |value| <= 1 by Cauchy-Schwarz, only rounding errors need the exact rules
+        indices = np.flatnonzero(~(np.abs(normed) < 1.0))
+        if indices.size:
+            num = numerator.flat[indices]
+            t = window_norm.flat[indices] * template_norm
+            abs_num = np.abs(num)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                normed.flat[indices] = np.where(abs_num < t, num / t,
+                                                np.where(abs_num < t * 1.125, np.sign(num), outside))
+        return normed
+
+    def derive_method_map(self, method, ccorr, window_sum, window_sqsum, terms=None):
+        """
+        Build the result map of any matching method from the raw cross-correlation and window sums.
+        Normalisation follows cv2.matchTemplate, including its handling of flat (zero variance) windows.
+        terms holds window norms shared between methods (see method_terms), missing ones are computed.
+        """
+        if terms is None:
+            terms = {}
+        if method in (cv2.TM_CCORR_NORMED, cv2.TM_SQDIFF_NORMED) and 'window_norm' not in terms:
+            terms.update(self.method_terms(window_sum, window_sqsum, (method,)))
+        if method == cv2.TM_CCOEFF_NORMED and 'coeff_norm' not in terms:
+            terms.update(self.method_terms(window_sum, window_sqsum, (method,)))
+        
+        pixel_count = self.template_h * self.template_w
+        template_mean = self.template_sum / pixel_count
+        
+        if method in (cv2.TM_CCOEFF, cv2.TM_CCOEFF_NORMED):
+            numerator = cv2.addWeighted(ccorr, 1.0, window_sum, -template_mean, 0.0)
+            if method == cv2.TM_CCOEFF:
+                return numerator.astype(np.float32)
+            
+            # A flat template correlates equally well everywhere
+            template_norm = math.sqrt(max(self.template_sqsum - self.template_sum * template_mean, 0.0))
+            if template_norm < np.finfo(np.float64).eps:
+                return np.ones(ccorr.shape, dtype=np.float32)
+            return self.normalize_map(numerator, terms['coeff_norm'], terms['coeff_flat'], template_norm, method)
+        
+        if method in self.SQDIFF_METHODS:
+            numerator = cv2.addWeighted(window_sqsum, 1.0, ccorr, -2.0, self.template_sqsum)
         else:
-            screenshot = cv2.cvtColor(screenshot_path, cv2.COLOR_BGR2GRAY)
+            numerator = ccorr
+        
+        if method in (cv2.TM_CCORR, cv2.TM_SQDIFF):
+            return numerator.astype(np.float32)
+        return self.normalize_map(numerator, terms['window_norm'], terms['window_flat'],
+                                  math.sqrt(self.template_sqsum), method)
+
+    def fft_match_template(self, frame, method):
+        """Frequency domain equivalent of cv2.matchTemplate(frame.gray, self.template, method)."""
+        ccorr = self.fft_cross_correlation(frame)
+        window_sum, window_sqsum = self.window_sums(frame)
+        return self.derive_method_map(method, ccorr, window_sum, window_sqsum)
+
+    def combined_parts(self, frame):
+        """
+        (ccorr, window_sum, window_sqsum, terms) shared by every method in combined mode.
+        Computed once per frame (or sub-frame) and scale, and released at the end of each search.
+        """
+        key = (id(frame), self.scale)
+        with self.lock:
+            if key not in self.combined_cache:
+                if self.use_fft(frame):
+                    ccorr = self.fft_cross_correlation(frame)
+                else:
+                    ccorr = self.match_into_buffer(frame.gray, self.template, cv2.TM_CCORR).astype(np.float64)
+                window_sum, window_sqsum = self.window_sums(frame)
+                methods = [self.METHODS[m] for m in (self.active_methods or self.methods)]
+                terms = self.method_terms(window_sum, window_sqsum, methods)
+                # The frame is kept with its parts so its id cannot be reused while the entry exists
+                self.combined_cache[key] = (frame, (ccorr, window_sum, window_sqsum, terms))
+            return self.combined_cache[key][1]
+
+    def prefilter_mask(self, frame):
+        """Positions whose window mean and standard deviation are close enough to the template's to match."""
+        # Window mean and variance at every position, from the window sums the combined mode uses too
+        pixel_count = self.template_h * self.template_w
+        window_sum, window_sqsum = self.window_sums(frame)
+        window_mean = window_sum / pixel_count
+        window_var = window_sqsum / pixel_count - window_mean * window_mean
         
-        # Store results for all methods
-        match_results = {}
-        threshold_failures = []
+        template_mean = self.template_sum / pixel_count
+        template_std = math.sqrt(max(self.template_sqsum / pixel_count - template_mean * template_mean, 0.0))
         
-        # First pass: Get match results and check threshold for each method
-        for method_name in self.methods:
-            method = self.METHODS.get(method_name)
-            result = cv2.matchTemplate(screenshot, self.template, method)
+        # |std - template std| <= tolerance, compared as variances to avoid a square root per position
+        low_std = template_std - self.prefilter_std_tolerance
+        low_var = low_std * low_std if low_std > 0 else -np.inf
+        high_std = template_std + self.prefilter_std_tolerance
+        mean_ok = cv2.inRange(window_mean, template_mean - self.prefilter_mean_tolerance,
+                              template_mean + self.prefilter_mean_tolerance)
+        var_ok = cv2.inRange(window_var, low_var, high_std * high_std)
+        return cv2.bitwise_and(mean_ok, var_ok)
+
+    def prefilter_windows(self, frame):
+        """
+        Return (pruned fraction, [(sub-frame, uint8 survivor mask)]) for a frame, computed once per frame and scale.
+        Surviving positions are grouped on a coarse block grid, so correlation runs on a few sub-frames.
+        """
+        with self.lock:
+            cached = self.prefilter_cache
+            if cached and cached[0] is frame and cached[1] == self.scale:
+                return cached[2]
+            
+            mask = self.prefilter_mask(frame)
+            result_h, result_w = mask.shape
+            survivors = np.count_nonzero(mask)
+            pruned = 1.0 - survivors / mask.size
             
-            # For SQDIFF methods, the best match is the minimum value
-            if method in [cv2.TM_SQDIFF, cv2.TM_SQDIFF_NORMED]:
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                match_value = 1.0 - min_val if method == cv2.TM_SQDIFF_NORMED else -min_val
-                match_location = min_loc
+            if survivors == 0:
+                windows = []
             else:
-                min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
-                match_value = max_val
-                match_location = max_loc
+                # Blocks holding any surviving position, connected blocks become one sub-frame
+                block = self.PREFILTER_BLOCK
+                grid_h, grid_w = -(-result_h // block), -(-result_w // block)
+                padded = np.zeros((grid_h * block, grid_w * block), dtype=bool)
+                padded[:result_h, :result_w] = mask > 0
+                grid = padded.reshape(grid_h, block, grid_w, block).any(axis=(1, 3)).astype(np.uint8)
+                _, _, boxes, _ = cv2.connectedComponentsWithStats(grid, connectivity=8)
+                
+                windows = []
+                for grid_x, grid_y, grid_box_w, grid_box_h, _ in boxes[1:]:
+                    x0, y0 = grid_x * block, grid_y * block
+                    x1, y1 = min(result_w, (grid_x + grid_box_w) * block), min(result_h, (grid_y + grid_box_h) * block)
+                    # A sub-frame with (x1 - x0) x (y1 - y0) positions also needs the template size around them
+                    sub_frame = frame.region(frame.offset[0] + x0, frame.offset[1] + y0,
+                                             x1 - x0 + self.template_w - 1, y1 - y0 + self.template_h - 1)
+                    windows.append((sub_frame, mask[y0:y1, x0:x1]))
+                
+                # Scattered survivors leave little to skip, one full-frame correlation is cheaper then
+                frame_h, frame_w = frame.shape
+                window_area = sum(window.shape[0] * window.shape[1] for window, _ in windows)
+                if window_area > self.PREFILTER_FULL_FRAME * frame_h * frame_w:
+                    windows = [(frame, mask)]
+            
+            self.prefilter_cache = (frame, self.scale, (pruned, windows))
+            return pruned, windows
+
+    def match_prefiltered(self, frame, method):
+        """Best (value, location) among the positions that survived the pre-filter."""
+        best_value, best_location = None, None
+        for window, mask in self.prefilter_windows(frame)[1]:
+            value, loc = self.best_in_result(self.correlate(window, method), method, mask)
+            if best_value is None or value > best_value:
+                best_value = value
+                best_location = (loc[0] + window.offset[0] - frame.offset[0], loc[1] + window.offset[1] - frame.offset[1])
+        return best_value, best_location
+
+    def usable_pyramid_levels(self, screenshot):
+        """Number of pyramid levels that keep the template large enough to match reliably."""
+        levels = 0
+        while levels < self.pyramid_levels:
+            template_h, template_w = self.template_pyramid[levels + 1].shape
+            if min(template_w, template_h) < self.MIN_PYRAMID_TEMPLATE_SIZE:
+                break
+            levels += 1
+        
+        # A screenshot smaller than the template cannot be searched coarsely either
+        if screenshot.shape[0] < self.template_h or screenshot.shape[1] < self.template_w:
+            return 0
+        return levels
+
+    def top_candidates(self, result, method, count, radius_x, radius_y):
+        """Pick up to `count` best locations from a result map, suppressing neighbours of each pick."""
+        result = result.copy()
+        is_sqdiff = method in self.SQDIFF_METHODS
+        suppressed_value = float('inf') if is_sqdiff else -float('inf')
+        
+        candidates = []
+        for _ in range(count):
+            min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(result)
+            value, loc = (min_val, min_loc) if is_sqdiff else (max_val, max_loc)
+            if not np.isfinite(value):
+                break
+            candidates.append(loc)
             
-            # Store result for this method
-            match_results[method_name] = {
-                'value': match_value,
-                'location': match_location
+            # Blank out the area around this candidate so the next pick is a different spot
+            x, y = loc
+            result[max(0, y - radius_y):y + radius_y + 1, max(0, x - radius_x):x + radius_x + 1] = suppressed_value
+        return candidates
+
+    def match_pyramid(self, frame, method):
+        """
+        Coarse-to-fine search: match the downscaled template against the downscaled frame,
+        then refine the best candidates in small full-resolution windows.
+        """
+        screenshot = frame.gray
+        levels = self.usable_pyramid_levels(screenshot)
+        if levels == 0:
+            return self.best_in_result(self.correlate(frame, method), method)
+        
+        # Coarse pass on the smallest usable level (shared by every matcher through the frame)
+        coarse_screenshot = frame.pyramid(levels)
+        coarse_template = self.template_pyramid[levels]
+        coarse_result = self.match_into_buffer(coarse_screenshot, coarse_template, method)
+        
+        coarse_h, coarse_w = coarse_template.shape
+        candidates = self.top_candidates(coarse_result, method, self.pyramid_candidates,
+                                         max(1, coarse_w // 2), max(1, coarse_h // 2))
+        
+        # Fine pass: full resolution windows around each candidate
+        scale = 2 ** levels
+        margin = 2 * scale
+        screen_h, screen_w = screenshot.shape
+        best_value, best_location = None, None
+        for coarse_x, coarse_y in candidates:
+            x0 = max(0, coarse_x * scale - margin)
+            y0 = max(0, coarse_y * scale - margin)
+            x1 = min(screen_w, coarse_x * scale + margin + self.template_w)
+            y1 = min(screen_h, coarse_y * scale + margin + self.template_h)
+            if x1 - x0 < self.template_w or y1 - y0 < self.template_h:
+                continue
+            
+            # The coarse map shares the method buffer, its candidates were already taken
+            result = self.match_into_buffer(screenshot[y0:y1, x0:x1], self.template, method)
+            value, loc = self.best_in_result(result, method)
+            if best_value is None or value > best_value:
+                best_value, best_location = value, (loc[0] + x0, loc[1] + y0)
+        
+        # Every window got clipped away - fall back to a full resolution search
+        if best_value is None:
+            return self.best_in_result(self.correlate(frame, method), method)
+        
+        return best_value, best_location
+
+    def fits(self, frame):
+        """Whether the template fits inside the frame at least once."""
+        if frame is None:
+            return False
+        frame_h, frame_w = frame.shape
+        return frame_h >= self.template_h and frame_w >= self.template_w
+
+    def empty_results(self, match_status):
+        """Match results for a search that could not run any method."""
+        return MatchResult.empty(match_status, self.threshold, self.distance_threshold)
+
+    def match_score(self, match_results):
+        """
+        Score used to compare matches found at different scales: the TM_CCOEFF_NORMED value if it ran,
+        otherwise the weakest normed value (TM_CCORR_NORMED, the usual maximum, barely tells scales apart).
+        """
+        if 'TM_CCOEFF_NORMED' in match_results.methods:
+            return float(match_results.values[match_results.methods.index('TM_CCOEFF_NORMED')])
+        normed_values = match_results.values[match_results.normed_mask]
+        return float(normed_values.min()) if normed_values.size else 0.0
+
+    def match_template(self, frame):
+        """
+        Match the template against a frame and return (best_match, match_results).
+        best_match is (x, y, w, h) in frame-global coordinates, or None if no match was found.
+        """
+        # Frames are shared between matchers so the grayscale conversion happens once per capture.
+        # Paths and raw images are still accepted and wrapped on the fly.
+        frame = Frame.from_source(frame)
+        self.stats['pool_seconds'] = 0.0
+        self.stats['prefilter_pruned'] = 0.0
+        self.stats['fingerprint_hit'] = False
+        
+        # Multi-instance templates act on the Nth instance rather than the single best match
+        if self.instance_index is not None:
+            return self.match_instance(frame)
+        
+        # Result buffers are sized for one monitor, a different geometry starts over
+        if frame.monitor_key != self.buffer_geometry:
+            self.result_buffers = {}
+            self.buffer_geometry = frame.monitor_key
+            self.stats['buffer_bytes'] = 0
+        
+        # The template is still where it was if the pixels of the last hit did not change
+        cached = self.check_fingerprint(frame)
+        if cached is not None:
+            return cached
+        
+        # Once a scale has won on this monitor only that scale is tried
+        monitor_key = frame.monitor_key
+        scales = [self.scale_cache[monitor_key]] if monitor_key in self.scale_cache else self.scales
+        
+        best_match, match_results, best_score = None, None, None
+        for scale in scales:
+            self.set_scale(scale)
+            scale_match, scale_results = self.search(frame)
+            scale_results.scale = scale
+            
+            if scale_match is None:
+                # Keep the first miss so there is always something to report
+                if match_results is None:
+                    match_results = scale_results
+                continue
+            
+            score = self.match_score(scale_results)
+            if best_score is None or score > best_score:
+                best_match, match_results, best_score = scale_match, scale_results, score
+        
+        # Remember the winning scale for this monitor
+        if best_match is not None and len(self.scales) > 1:
+            if monitor_key not in self.scale_cache:
+                print(f"Template scale {match_results.scale} selected for monitor {monitor_key}")
+            self.scale_cache[monitor_key] = match_results.scale
+            self.set_scale(match_results.scale)
+        
+        self.last_hit = best_match
+        self.remember_fingerprint(frame, best_match, match_results)
+        return best_match, match_results
+
+    def patch_hash(self, frame, box):
+        """Digest of the grayscale pixels under a frame-global (x, y, w, h) box, None if the box leaves the frame."""
+        x, y, w, h = box
+        patch = frame.region(x, y, w, h)
+        if patch is None or patch.shape != (h, w):
+            return None
+        return hashlib.blake2b(np.ascontiguousarray(patch.gray), digest_size=16).digest()
+
+    def remember_fingerprint(self, frame, best_match, match_results):
+        """Keep the hash of the matched patch so an unchanged patch can skip the next search."""
+        self.last_fingerprint = None
+        if best_match is None or self.last_hit_max_age <= 0:
+            return
+        
+        patch_hash = self.patch_hash(frame, best_match)
+        if patch_hash is not None:
+            self.last_fingerprint = {
+                'box': best_match,
+                'hash': patch_hash,
+                'monitor_key': frame.monitor_key,
+                'match_results': match_results,
+                'time': time.monotonic()
             }
+
+    def check_fingerprint(self, frame):
+        """
+        Return the previous (best_match, match_results) if the last hit's patch is unchanged, otherwise None.
+        The age counts from the last full search, so the template is searched again at least every max age.
+        """
+        fingerprint = self.last_fingerprint
+        if fingerprint is None:
+            return None
+        if time.monotonic() - fingerprint['time'] > self.last_hit_max_age:
+            self.last_fingerprint = None
+            return None
+        if fingerprint['monitor_key'] != frame.monitor_key or self.patch_hash(frame, fingerprint['box']) != fingerprint['hash']:
+            return None
+        
+        self.stats['fingerprint_hit'] = True
+        return fingerprint['box'], fingerprint['match_results']
+
+    def instance_method(self):
+        """Normed method used to score instances in find_all."""
+        for method_name in ('TM_CCOEFF_NORMED', 'TM_SQDIFF_NORMED', 'TM_CCORR_NORMED'):
+            if method_name in self.methods:
+                return method_name
+        return 'TM_CCOEFF_NORMED'
+
+    def non_max_suppression(self, xs, ys, scores, max_instances):
+        """Greedy NMS over template-sized boxes, vectorized per pick. Returns kept indices, best first."""
+        w, h = self.template_w, self.template_h
+        order = np.argsort(-scores, kind='stable')
+        kept = []
+        while order.size and len(kept) < max_instances:
+            best = order[0]
+            kept.append(best)
+            rest = order[1:]
+            
+            # Overlap of the best box with every remaining box (all boxes have the template size)
+            overlap_w = np.clip(w - np.abs(xs[rest] - xs[best]), 0, None)
+            overlap_h = np.clip(h - np.abs(ys[rest] - ys[best]), 0, None)
+            intersection = overlap_w * overlap_h
+            iou = intersection / (2.0 * w * h - intersection)
+            order = rest[iou <= self.NMS_OVERLAP]
+        return np.array(kept, dtype=np.int64)
+
+    def find_all(self, frame, max_instances=None, order=None):
+        """
+        Find every instance of the template in the frame.
+        Returns a list of (x, y, w, h, score) in frame-global coordinates, at most max_instances long,
+        ordered by 'score' (best first), 'top_to_bottom' or 'left_to_right'.
+        """
+        frame = Frame.from_source(frame)
+        max_instances = self.max_instances if max_instances is None else max_instances
+        order = order or self.instance_order
+        
+        search_frame = frame.region(*self.search_region) if self.search_region else frame
+        if not self.fits(search_frame):
+            return []
+        
+        # Score map of one normed method, higher = better
+        method = self.METHODS[self.instance_method()]
+        result = self.correlate(search_frame, method)
+        self.combined_cache.clear()
+        scores = 1.0 - result if method == cv2.TM_SQDIFF_NORMED else result
+        
+        # Candidates are local maxima above the threshold, NMS then removes overlapping boxes
+        local_max = scores >= cv2.dilate(scores, np.ones((3, 3), np.uint8))
+        ys, xs = np.nonzero(local_max & (scores >= self.threshold))
+        if xs.size == 0:
+            return []
+        candidate_scores = scores[ys, xs].astype(np.float64)
+        kept = self.non_max_suppression(xs, ys, candidate_scores, max_instances)
+        xs, ys, candidate_scores = xs[kept], ys[kept], candidate_scores[kept]
+        
+        if order == 'top_to_bottom':
+            kept_order = np.lexsort((xs, ys))
+        elif order == 'left_to_right':
+            kept_order = np.lexsort((ys, xs))
+        else:
+            kept_order = np.arange(len(kept))
+        
+        offset_x, offset_y = search_frame.offset
+        return [(int(xs[i]) + offset_x, int(ys[i]) + offset_y, self.template_w, self.template_h, float(candidate_scores[i]))
+                for i in kept_order]
+
+    def match_instance(self, frame):
+        """Multi-instance variant of match_template: pick the configured instance from find_all."""
+        instances = self.find_all(frame)
+        method_name = self.instance_method()
+        
+        if self.instance_index < len(instances):
+            x, y, w, h, score = instances[self.instance_index]
+            match_results = MatchResult([method_name], [self.METHODS[method_name]], [score], [(x, y)],
+                                        self.threshold, self.distance_threshold,
+                                        f"MATCH FOUND - Instance {self.instance_index + 1} of {len(instances)} ({self.instance_order})")
+            match_results.best_index = 0
+            return (x, y, w, h), match_results
+        
+        return None, self.empty_results(f"MATCH NOT FOUND - Instance {self.instance_index + 1} requested, "
+                                        f"{len(instances)} found")
+
+    @classmethod
+    def create_detector(cls, engine):
+        """Feature detector of a keypoint engine, created per use since detectors are not thread-safe."""
+        if engine == 'akaze':
+            return cv2.AKAZE_create()
+        return cv2.ORB_create(cls.KEYPOINT_FEATURES, edgeThreshold=cls.KEYPOINT_PATCH_SIZE,
+                              patchSize=cls.KEYPOINT_PATCH_SIZE)
+
+    def keypoint_results(self, value, location, match_status):
+        """MatchResult of the keypoint engine, which reports as a single method named after the engine."""
+        return MatchResult((self.engine.upper(),), (-1,), (value,), (location,),
+                           self.threshold, self.distance_threshold, match_status)
+
+    def match_keypoints(self, frame):
+        """
+        Keypoint engine: match the template descriptors against the frame's (shared by every template
+        using the engine) and fit a homography. The match is the bounding box of the projected template.
+        """
+        template_points, template_descriptors = self.template_features
+        frame_points, frame_descriptors = frame.keypoints(self.engine, lambda: self.create_detector(self.engine))
+        offset_x, offset_y = frame.offset
+        no_location = (offset_x, offset_y)
+        if template_descriptors is None or frame_descriptors is None or len(frame_descriptors) < 2:
+            return None, self.keypoint_results(0.0, no_location, "MATCH NOT FOUND - No keypoints to match")
+        
+        # Lowe ratio test: keep matches clearly better than the second best candidate
+        pairs = cv2.BFMatcher(cv2.NORM_HAMMING).knnMatch(template_descriptors, frame_descriptors, k=2)
+        good = [best for best, second in (pair for pair in pairs if len(pair) == 2)
+                if best.distance < self.KEYPOINT_RATIO * second.distance]
+        if len(good) < self.keypoint_min_inliers:
+            return None, self.keypoint_results(0.0, no_location, f"MATCH NOT FOUND - Only {len(good)} keypoint matches "
+                                                                 f"(need {self.keypoint_min_inliers})")
+        
+        source = template_points[[match.queryIdx for match in good]]
+        destination = frame_points[[match.trainIdx for match in good]]
+        homography, inlier_mask = cv2.findHomography(source, destination, cv2.RANSAC, self.KEYPOINT_RANSAC_THRESHOLD)
+        inliers = int(inlier_mask.sum()) if inlier_mask is not None else 0
+        value = inliers / len(good)
+        if homography is None or inliers < self.keypoint_min_inliers:
+            return None, self.keypoint_results(value, no_location, f"MATCH NOT FOUND - Only {inliers} keypoint inliers "
+                                                                   f"(need {self.keypoint_min_inliers})")
+        
+        # A folded or collapsed outline means the inliers do not describe a real view of the template
+        original_h, original_w = self.original_template.shape
+        corners = np.float32([[0, 0], [original_w, 0], [original_w, original_h], [0, original_h]]).reshape(-1, 1, 2)
+        projected = cv2.perspectiveTransform(corners, homography)
+        x, y, w, h = cv2.boundingRect(projected)
+        if not cv2.isContourConvex(projected) or w < 2 or h < 2:
+            return None, self.keypoint_results(value, no_location, "MATCH NOT FOUND - Degenerate keypoint homography")
+        
+        best_match = (x + offset_x, y + offset_y, w, h)
+        match_results = self.keypoint_results(value, best_match[:2], f"MATCH FOUND - {inliers} keypoint inliers")
+        match_results.best_index = 0
+        return best_match, match_results
+
+    def search_area(self, frame):
+        """Frame-global (x, y, w, h) area searched in a frame: the search region or the whole frame, None if empty."""
+        search_frame = frame.region(*self.search_region) if self.search_region else frame
+        if search_frame is None:
+            return None
+        frame_h, frame_w = search_frame.shape
+        return (search_frame.offset[0], search_frame.offset[1], frame_w, frame_h)
+
+    def search(self, frame):
+        """Search the active template in the search region of the frame, trying the last-hit window first."""
+        # Restrict the search to the configured region of the frame
+        search_frame = frame.region(*self.search_region) if self.search_region else frame
+        
+        # Look around the previous hit first, the full search area is only needed on a miss
+        if self.last_hit and self.hint_padding > 0 and search_frame is not None:
+            x, y, w, h = self.last_hit
+            padding = self.hint_padding
+            hint_frame = search_frame.region(x - padding, y - padding, w + 2 * padding, h + 2 * padding)
+            if self.fits(hint_frame):
+                best_match, match_results = self.match_in_frame(hint_frame)
+                if best_match:
+                    return best_match, match_results
+        
+        if not self.fits(search_frame):
+            return None, self.empty_results("MATCH NOT FOUND - Search region is smaller than the template")
+        
+        return self.match_in_frame(search_frame)
+
+    def match_in_frame(self, frame):
+        """Run the methods on the frame and decide on a match, locations are frame-global."""
+        if self.engine in self.KEYPOINT_ENGINES:
+            return self.match_keypoints(frame)
+        
+        pruned = 0.0
+        if self.prefilter and self.pyramid_levels == 0:
+            pruned, windows = self.prefilter_windows(frame)
+            self.stats['prefilter_pruned'] = pruned
+            if not windows:
+                match_results = self.empty_results("MATCH NOT FOUND - Pre-filter ruled out every position")
+                match_results.pruned_fraction = pruned
+                return None, match_results
+        
+        # Warm-up and audit searches run every method (without early exits) to record the decision
+        audit = self.audit_due()
+        if audit:
+            method_names, values, locations = self.run_methods(frame, self.methods)
+        elif self.cascade:
+            method_names, values, locations = self.run_cascade(frame, self.active_methods or self.methods)
+        else:
+            method_names, values, locations = self.run_methods(frame, self.active_methods or self.methods)
+        
+        # The combined mode's shared maps are only needed while the methods run
+        self.combined_cache.clear()
+        
+        match_results = MatchResult(method_names, [self.METHODS[m] for m in method_names], values, locations,
+                                    self.threshold, self.distance_threshold)
+        match_results.pruned_fraction = pruned
+        best_match, match_results = self.decide(match_results)
+        if audit:
+            self.record_decision(match_results, best_match)
+        return best_match, match_results
+
+    def audit_due(self):
+        """Whether the next search runs every method: always without adaptive methods, during warm-up and on audits."""
+        if not self.adaptive_methods:
+            return False
+        self.searches_since_audit += 1
+        if self.active_methods is None or self.searches_since_audit >= self.adaptive_audit_interval:
+            self.searches_since_audit = 0
+            return True
+        return False
+
+    def record_decision(self, match_results, best_match):
+        """Remember an all-method search and how each method related to its decision, then update the active subset."""
+        decision = tuple(best_match[:2]) if best_match else None
+        self.method_history.append((match_results.values.copy(), match_results.locations.copy(), decision))
+        
+        # A method agrees with a match if it passes the threshold near the match location,
+        # and with a miss if it does not point at a match of its own
+        passes = ~match_results.normed_mask | (match_results.values >= match_results.threshold)
+        if decision is not None:
+            near = np.hypot(*(match_results.locations - decision).T) <= self.distance_threshold
+            agrees = passes & near
+        else:
+            agrees = ~(passes & match_results.agreement.any(axis=1))
+        for method, agreed in zip(match_results.methods, agrees):
+            counts = self.method_agreement.setdefault(method, [0, 0])
+            counts[0] += int(agreed)
+            counts[1] += 1
+        self.stats['method_agreement'] = {method: agreed / total for method, (agreed, total) in self.method_agreement.items()}
+        
+        if len(self.method_history) >= self.adaptive_warmup:
+            self.update_active_methods()
+
+    def reproduces_history(self, indices):
+        """Whether deciding with only the methods at `indices` gives the recorded decision for every past search."""
+        method_names = [self.methods[i] for i in indices]
+        method_ids = [self.METHODS[m] for m in method_names]
+        for values, locations, decision in self.method_history:
+            match_results = MatchResult(method_names, method_ids, values[indices], locations[indices],
+                                        self.threshold, self.distance_threshold)
+            best_match, _ = self.decide(match_results)
+            if (best_match is None) != (decision is None):
+                return False
+            if best_match is not None and math.hypot(best_match[0] - decision[0], best_match[1] - decision[1]) > self.ADAPTIVE_LOCATION_TOLERANCE:
+                return False
+        return True
+
+    def threshold_gate_method(self):
+        """
+        Index of the normed method every subset has to keep, None if no normed method is configured.
+        Without one the threshold would stop applying, and a history without misses cannot show that it is
+        safe to drop: the method that failed the threshold most often is kept, TM_CCOEFF_NORMED on a tie.
+        """
+        normed = [i for i, method in enumerate(self.methods) if 'NORMED' in method]
+        if not normed:
+            return None
+        failures = {i: sum(int(values[i] < self.threshold) for values, _, _ in self.method_history) for i in normed}
+        return max(normed, key=lambda i: (failures[i], self.methods[i] == 'TM_CCOEFF_NORMED', -i))
+
+    def update_active_methods(self):
+        """
+        Pick the smallest method subset (at least two methods, so agreement stays possible, and the threshold
+        gate method) that reproduces the history.
+        """
+        gate = self.threshold_gate_method()
+        active_methods = list(self.methods)
+        for size in range(min(2, len(self.methods)), len(self.methods)):
+            subset = next((list(indices) for indices in itertools.combinations(range(len(self.methods)), size)
+                           if (gate is None or gate in indices) and self.reproduces_history(list(indices))), None)
+            if subset is not None:
+                active_methods = [self.methods[i] for i in subset]
+                break
+        
+        if active_methods != self.active_methods:
+            dropped = [m for m in self.methods if m not in active_methods]
+            print(f"Adaptive methods for {os.path.basename(self.template_path)}: {', '.join(active_methods)}"
+                  f" (dropped: {', '.join(dropped) or 'none'})")
+        self.active_methods = active_methods
+        self.stats['active_methods'] = active_methods
+
+    def timed_match_method(self, frame, method_name):
+        """match_method plus the CPU time it took, the unit of work scheduled on the thread pool."""
+        start = time.thread_time()
+        match_value, match_location = self.match_method(frame, method_name)
+        return match_value, match_location, time.thread_time() - start
+
+    def run_methods(self, frame, method_names, stop_on_failure=False):
+        """
+        First pass: get the value and frame-global location of each method.
+        With stop_on_failure the remaining methods are skipped after the first normed method below the threshold.
+        """
+        offset_x, offset_y = frame.offset
+        
+        # Independent methods run on the thread pool (cv2.matchTemplate releases the GIL), results keep method order
+        on_pool = self.executor is not None and not stop_on_failure and len(method_names) > 1
+        if on_pool:
+            outcomes = self.executor.map(lambda method_name: self.timed_match_method(frame, method_name), method_names)
+        else:
+            outcomes = (self.timed_match_method(frame, method_name) for method_name in method_names)
+        
+        ran_methods, values, locations = [], [], []
+        for method_name, (match_value, match_location, seconds) in zip(method_names, outcomes):
+            ran_methods.append(method_name)
+            values.append(match_value)
+            locations.append((match_location[0] + offset_x, match_location[1] + offset_y))
+            if on_pool:
+                self.stats['pool_seconds'] += seconds
             
             # For normed methods, check threshold
-            if 'NORMED' in method_name and match_value < self.threshold:
-                threshold_failures.append(method_name)
+            if stop_on_failure and 'NORMED' in method_name and match_value < self.threshold:
+                break
         
-        # Second pass: Check distances between all matches and track agreeing methods
-        distance_failures = []
-        method_names = [m for m in match_results.keys()]
+        return ran_methods, values, locations
+
+    def run_cascade(self, frame, method_names):
+        """
+        Early-exit variant of the first pass: the cheapest normed method searches the whole frame,
+        any normed method below the threshold ends the search, and the remaining methods only
+        search a window around the candidate.
+        """
+        normed_methods = [m for m in self.CASCADE_ORDER if m in method_names]
+        if not normed_methods:
+            return self.run_methods(frame, method_names)
         
-        # Track which methods have close matches with other methods
-        agreeing_methods = {method: set() for method in method_names}
+        first_method = normed_methods[0]
+        first_names, values, locations = self.run_methods(frame, [first_method], stop_on_failure=True)
+        if values[0] < self.threshold:
+            return first_names, values, locations
         
-        for i in range(len(method_names)):
-            for j in range(i+1, len(method_names)):
-                method1 = method_names[i]
-                method2 = method_names[j]
-                
-                loc1 = match_results[method1]['location']
-                loc2 = match_results[method2]['location']
-                
-                # Calculate distance between match locations
-                distance = self.calculate_distance(loc1, loc2)
-                
-                # Store distance in results for visualization
-                match_results[method1]['distance_to_' + method2] = distance
-                match_results[method2]['distance_to_' + method1] = distance
-                
-                # Check if distance is within threshold
-                if distance <= self.distance_threshold:
-                    # These methods agree with each other
-                    agreeing_methods[method1].add(method2)
-                    agreeing_methods[method2].add(method1)
-                else:
-                    distance_failures.append((method1, method2, distance))
+        # Methods further than the distance threshold from the candidate could not agree with it anyway
+        x, y = locations[0]
+        padding = self.distance_threshold
+        window = frame.region(x - padding, y - padding, self.template_w + 2 * padding, self.template_h + 2 * padding)
+        if not self.fits(window):
+            window = frame
         
-        # Count methods that have at least one agreement with another method
-        agreeing_method_count = sum(1 for method, agreements in agreeing_methods.items() if len(agreements) > 0)
+        remaining_methods = normed_methods[1:] + [m for m in method_names if m not in normed_methods]
+        window_names, window_values, window_locations = self.run_methods(window, remaining_methods, stop_on_failure=True)
+        return first_names + window_names, values + window_values, locations + window_locations
+
+    def decide(self, match_results):
+        """Second pass: check threshold and agreement between the method results and pick the best match."""
+        threshold_failures = match_results.threshold_failures
+        agreeing_method_count = match_results.agreeing_method_count
+        best_match = None
         
         # Determine match status - need at least two methods in agreement
         if threshold_failures:
-            match_status = f"MATCH NOT FOUND - Methods below threshold: {', '.join(threshold_failures)}"
-            best_match = None
+            match_results.match_status = f"MATCH NOT FOUND - Methods below threshold: {', '.join(threshold_failures)}"
         elif agreeing_method_count < 2:
             # Not enough methods agree with each other
-            close_pairs = [f"{m1}-{m2}" for m1, agreements in agreeing_methods.items() for m2 in agreements if m1 < m2]
-            if close_pairs:
-                match_status = f"MATCH NOT FOUND - Only {agreeing_method_count} methods in agreement: {', '.join(close_pairs)}"
-            else:
-                match_status = f"MATCH NOT FOUND - No methods agree with each other"
-            best_match = None
+            match_results.match_status = "MATCH NOT FOUND - No methods agree with each other"
         else:
-            match_status = f"MATCH FOUND - {agreeing_method_count} methods in agreement"
-            
-            # Find the best match among agreeing methods
-            best_value = -float('inf')
-            best_method = None
+            match_results.match_status = f"MATCH FOUND - {agreeing_method_count} methods in agreement"
             
-            # Get the methods that have the most agreements
-            most_agreeing = max(agreeing_methods.items(), key=lambda x: len(x[1]))[0]
-            agreeing_set = {most_agreeing} | agreeing_methods[most_agreeing]
+            # Get the method that has the most agreements and the methods agreeing with it
+            agreement = match_results.agreement
+            most_agreeing = int(np.argmax(agreement.sum(axis=1)))
+            agreeing_set = agreement[most_agreeing].copy()
+            agreeing_set[most_agreeing] = True
             
-            for method_name in agreeing_set:
-                result = match_results[method_name]
-                if result['value'] > best_value:
-                    best_value = result['value']
-                    best_method = method_name
-                    loc = result['location']
-                    best_match = (loc[0], loc[1], self.template_w, self.template_h)
-        
-        # Add match status to results
-        match_results['match_status'] = match_status
-        match_results['threshold'] = self.threshold
-        match_results['distance_pixels_threshold'] = self.distance_threshold
-        match_results['agreeing_methods'] = agreeing_methods
+            # Find the best match among agreeing methods
+            candidate_values = np.where(agreeing_set, match_results.values, -np.inf)
+            best_index = int(np.argmax(candidate_values))
+            match_results.best_index = best_index
             
-        return best_match, match_results
\ No newline at end of file
+            x, y = match_results.locations[best_index]
+            best_match = (int(x), int(y), self.template_w, self.template_h)
+        
+        return best_match, match_results
@@ -8,6 +8,10 @@ def display_results(screenshot, match_coordinates, match_results=None, template_
     # Create a copy of the screenshot to avoid modifying the original
     img = screenshot.copy()
     
+    # MatchResult objects are converted to the per-method dict format drawn below
+    if hasattr(match_results, 'to_dict'):
+        match_results = match_results.to_dict()
+    
     # Define colors for each method (BGR for OpenCV and RGB for matplotlib)
     method_colors = {
         'TM_CCOEFF': ((255, 0, 0), 'red'),         # Blue in OpenCV, Red in matplotlib
@@ -31,7 +35,7 @@ def display_results(screenshot, match_coordinates, match_results=None, template_
         cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 3)  # Thick green rectangle for best match
     
     # Define metadata fields to exclude from visualization
-    metadata_fields = ['match_status', 'threshold', 'distance_threshold', 'distance_pixels_threshold', 'agreeing_methods']
+    metadata_fields = ['match_status', 'threshold', 'distance_threshold', 'distance_pixels_threshold', 'agreeing_methods', 'scale', 'pruned_fraction']
     
     # Draw rectangles for each method's match
     if match_results: